@@ -0,0 +1,223 @@
+import warnings
+from functools import lru_cache
+
+import numpy as np
+
+from core_logic import to_number, item_field_keys, rubric_items
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+# Share of the class in the upper/lower groups of the discrimination index (Kelley's 27%)
+UPPER_LOWER_FRACTION = 0.27
+ITEM_HISTOGRAM_BINS = 5
+PASS_RATIO = 0.5
+
+
+@lru_cache(maxsize=1024)
+def _criterion_key(keys):
+    """Key naming the criterion of a breakdown row schema"""
+    for key in keys:
+        if any(word in key.lower() for word in ('element', 'criterion', 'critere', 'critère', 'name')):
+            return key
+    return None
+
+
+def _criterion_label(question_id, row):
+    key = _criterion_key(tuple(row))
+    return f"{question_id} – {row[key] if key else 'critère'}"
+
+
+def _first_seen_index(values):
+    """Distinct values in first-seen order (Q2 before Q10) and each entry's position among them"""
+    labels = np.asarray([str(v) for v in values], dtype=object)
+    _, first_seen, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first_seen), dtype=int)
+    rank[np.argsort(first_seen)] = np.arange(len(first_seen))
+    return labels[np.sort(first_seen)].tolist(), rank[inverse.ravel()]
+
+
+def _clean(value):
+    """numpy scalars/arrays to JSON-friendly Python values, NaN as None"""
+    if isinstance(value, np.ndarray):
+        return [_clean(v) for v in value.tolist()]
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else round(float(value), 4)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+class ClassAnalytics:
+    """
+    Class-level statistics over a set of graded copies, held as columnar
+    NumPy arrays: `scores` and `max_points` are (students x items) float
+    matrices, NaN where a copy has no score for an item. Items are questions
+    (level='question') or grading_breakdown criteria (level='criterion').
+    Every statistic is computed on whole columns at once.
+    """
+
+    def __init__(self, item_ids, scores, max_points, student_ids=None):
+        self.item_ids = list(item_ids)
+        self.scores = np.asarray(scores, dtype=float)
+        self.max_points = np.broadcast_to(np.asarray(max_points, dtype=float), self.scores.shape)
+        self.student_ids = list(student_ids) if student_ids is not None else None
+
+    @classmethod
+    def from_columns(cls, student_keys, item_ids, scores, max_points):
+        """Build from long-format columns (one entry per student/item pair), e.g. the result store's scores"""
+        students, student_index = _first_seen_index(student_keys)
+        items, item_index = _first_seen_index(item_ids)
+
+        matrix = np.full((len(students), len(items)), np.nan)
+        max_matrix = np.full((len(students), len(items)), np.nan)
+        matrix[student_index, item_index] = np.asarray(scores, dtype=float)
+        max_matrix[student_index, item_index] = np.asarray(max_points, dtype=float)
+        return cls(items, matrix, max_matrix, students)
+
+    @classmethod
+    def from_gradings(cls, gradings, level='question', student_ids=None):
+        """
+        Build from grading results as returned by the model (dicts with 'corrections'
+        or lists of items). Field names are resolved once per item schema, so the
+        only per-item work left in Python is reading three values.
+        """
+        columns = {}
+        rows, cols, scores, max_points = [], [], [], []
+
+        def add(student, label, item):
+            _, score_key, max_key = item_field_keys(tuple(item))
+            score = item[score_key] if score_key else None
+            maximum = item[max_key] if max_key else None
+            rows.append(student)
+            cols.append(columns.setdefault(label, len(columns)))
+            scores.append(score if type(score) in (int, float) else to_number(score) if score is not None else None)
+            max_points.append(maximum if type(maximum) in (int, float) else
+                              to_number(maximum) if maximum is not None else None)
+
+        student_count = 0
+        for student, grading in enumerate(gradings):
+            student_count = student + 1
+            for item in rubric_items(grading):
+                id_key = item_field_keys(tuple(item))[0]
+                question_id = str(item[id_key]) if id_key else "?"
+                breakdown = rubric_items(item) if level == 'criterion' else []
+                if breakdown:
+                    for row in breakdown:
+                        add(student, _criterion_label(question_id, row), row)
+                else:
+                    add(student, question_id, item)
+
+        matrix = np.full((student_count, len(columns)), np.nan)
+        max_matrix = np.full((student_count, len(columns)), np.nan)
+        if rows:
+            matrix[rows, cols] = np.array(scores, dtype=float)
+            max_matrix[rows, cols] = np.array(max_points, dtype=float)
+        ids = student_ids if student_ids is not None else list(range(student_count))
+        return cls(list(columns), matrix, max_matrix, ids)
+
+    @property
+    def student_count(self):
+        return self.scores.shape[0]
+
+    def totals(self):
+        """Total score and total max points per student"""
+        return np.nansum(self.scores, axis=1), np.nansum(self.max_points, axis=1)
+
+    def ratios(self):
+        """Score / max points per cell (NaN when missing or the max is 0)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.max_points > 0, self.scores / self.max_points, np.nan)
+
+    def difficulty(self):
+        """Item difficulty index: mean share of the max points earned (1 = everyone full marks)"""
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmean(self.ratios(), axis=0)
+
+    def discrimination(self):
+        """Corrected item-total correlation: each item against the total of the other items"""
+        if self.student_count == 0:
+            return np.full(len(self.item_ids), np.nan)
+        filled = np.nan_to_num(self.scores)
+        totals = filled.sum(axis=1)
+        rest = totals[:, None] - filled
+        item_centered = filled - filled.mean(axis=0)
+        rest_centered = rest - rest.mean(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (item_centered * rest_centered).sum(axis=0) / np.sqrt(
+                (item_centered ** 2).sum(axis=0) * (rest_centered ** 2).sum(axis=0)
+            )
+
+    def upper_lower_index(self, fraction=UPPER_LOWER_FRACTION):
+        """Difficulty in the top `fraction` of the class minus difficulty in the bottom one"""
+        if self.student_count < 2:
+            return np.full(len(self.item_ids), np.nan)
+        group = max(1, int(round(self.student_count * fraction)))
+        order = np.argsort(self.totals()[0], kind='stable')
+        ratios = self.ratios()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmean(ratios[order[-group:]], axis=0) - np.nanmean(ratios[order[:group]], axis=0)
+
+    def item_histograms(self, bins=ITEM_HISTOGRAM_BINS):
+        """(items x bins) counts of score ratios, bins evenly spread over [0, 1]"""
+        ratios = self.ratios()
+        valid = ~np.isnan(ratios)
+        bin_index = np.clip((np.nan_to_num(ratios) * bins).astype(int), 0, bins - 1)
+        flat = (np.arange(len(self.item_ids))[None, :] * bins + bin_index)[valid]
+        return np.bincount(flat, minlength=len(self.item_ids) * bins).reshape(len(self.item_ids), bins)
+
+    def summary(self, percentiles=DEFAULT_PERCENTILES, bins=10):
+        """Everything the class report needs, as a JSON-friendly dict"""
+        totals, max_totals = self.totals()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            percents = np.where(max_totals > 0, totals / max_totals * 100, np.nan)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            item_means = np.nanmean(self.scores, axis=0)
+            item_std = np.nanstd(self.scores, axis=0)
+            item_max = np.nanmax(self.max_points, axis=0) if self.student_count else np.full(len(self.item_ids), np.nan)
+            item_percentiles = np.nanpercentile(self.scores, percentiles, axis=0) if self.student_count \
+                else np.full((len(percentiles), len(self.item_ids)), np.nan)
+            total_percentiles = np.nanpercentile(totals, percentiles) if self.student_count \
+                else np.full(len(percentiles), np.nan)
+
+        answered = (~np.isnan(self.scores)).sum(axis=0)
+        difficulty = self.difficulty()
+        discrimination = self.discrimination()
+        upper_lower = self.upper_lower_index()
+        histograms = self.item_histograms()
+        counts, edges = np.histogram(percents[~np.isnan(percents)], bins=bins, range=(0, 100))
+
+        items = []
+        for i, item_id in enumerate(self.item_ids):
+            items.append({
+                "item_id": item_id,
+                "answered": int(answered[i]),
+                "max_points": _clean(item_max[i]),
+                "mean": _clean(item_means[i]),
+                "std": _clean(item_std[i]),
+                "percentiles": {f"p{p}": _clean(item_percentiles[j, i]) for j, p in enumerate(percentiles)},
+                "difficulty": _clean(difficulty[i]),
+                "discrimination": _clean(discrimination[i]),
+                "upper_lower_index": _clean(upper_lower[i]),
+                "histogram": _clean(histograms[i]),
+            })
+
+        has_students = self.student_count > 0
+        return {
+            "students": self.student_count,
+            "items": items,
+            "totals": {
+                "max_total": _clean(np.nanmax(max_totals)) if has_students else None,
+                "mean": _clean(totals.mean()) if has_students else None,
+                "std": _clean(totals.std()) if has_students else None,
+                "min": _clean(totals.min()) if has_students else None,
+                "max": _clean(totals.max()) if has_students else None,
+                "percentiles": {f"p{p}": _clean(total_percentiles[j]) for j, p in enumerate(percentiles)},
+                "pass_rate": _clean(np.mean(percents >= PASS_RATIO * 100)) if has_students else None,
+            },
+            "histogram": {"edges": _clean(edges), "counts": _clean(counts)},
+        }
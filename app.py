@@ -1,29 +1,162 @@
-from flask import Flask, request, jsonify, send_file
-from core_logic import AutoCorrectAI
-from fpdf import FPDF
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context, url_for
+from core_logic import AutoCorrectAI, CircuitOpenError, diff_rubrics, rubric_cache_key
+from jobs import JobManager, DONE, FAILED, QUEUED, RUNNING
+from result_store import InvalidCursorError
+import metrics
+import hashlib
+import io
+import json
 import os
-import pdf_generator
+import shutil
+import tempfile
+import threading
+import uuid
 
 app = Flask(__name__)
-ai_engine = AutoCorrectAI()
+# Created on first use (see get_ai_engine) so importing the app needs no credentials
+ai_engine = None
+_ai_engine_lock = threading.Lock()
+job_manager = JobManager()
+
+
+def get_ai_engine():
+    """Return the shared AutoCorrectAI, building it (and the model client) on first use"""
+    global ai_engine
+    if ai_engine is None:
+        with _ai_engine_lock:
+            if ai_engine is None:
+                ai_engine = AutoCorrectAI(backend=app.config.get('MODEL_BACKEND'))
+    return ai_engine
+
+
+def create_app(config=None):
+    """
+    App factory. `config` may set MODEL_BACKEND (e.g. 'fake') or AI_ENGINE (a ready
+    AutoCorrectAI); nothing touches the model or credentials until the first request.
+    """
+    global ai_engine
+    if config:
+        app.config.update(config)
+        if config.get('AI_ENGINE') is not None:
+            ai_engine = config['AI_ENGINE']
+    return app
 
 
 # Helper to generate PDF (s
 
-def create_pdf_report(grading_data, filename="report.pdf"):
+def get_reports_dir():
     # Ensure reports directory exists next to this file
     base_dir = os.path.dirname(__file__)
     reports_dir = os.path.join(base_dir, "reports")
     os.makedirs(reports_dir, exist_ok=True)
+    return reports_dir
+
+
+_pdf_generator = None
+
+
+def get_pdf_generator():
+    # PDF libraries are only imported once a report is actually rendered
+    global _pdf_generator
+    if _pdf_generator is None:
+        import pdf_generator
+        _pdf_generator = pdf_generator.SmartPDFGenerator()
+    return _pdf_generator
+
+
+_result_store = None
+_result_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """Shared ResultStore, opened on first use; None when RESULT_STORE_PATH is set to ''"""
+    global _result_store
+    if _result_store is None and app.config.get('RESULT_STORE_PATH', os.getenv('RESULT_STORE_PATH')) != '':
+        with _result_store_lock:
+            if _result_store is None:
+                import result_store
+                path = app.config.get('RESULT_STORE_PATH') or result_store.RESULT_STORE_PATH
+                _result_store = result_store.ResultStore(path)
+    return _result_store
+
+
+_task_queue = None
+_task_queue_lock = threading.Lock()
+
+
+def get_task_queue():
+    """
+    Durable queue shared with worker.py processes when TASK_QUEUE_PATH is set;
+    None (the default) keeps jobs in this process's JobManager.
+    """
+    global _task_queue
+    path = app.config.get('TASK_QUEUE_PATH', os.getenv('TASK_QUEUE_PATH'))
+    if _task_queue is None and path:
+        with _task_queue_lock:
+            if _task_queue is None:
+                import task_queue
+                _task_queue = task_queue.TaskQueue(path)
+    return _task_queue
+
 
-    # Use SmartPDFGenerator which now accepts lists or dicts
-    out_path = os.path.join(reports_dir, filename)
+def queued_job(task_id):
+    """A queue task shown like a JobManager job, or None if unknown"""
+    import task_queue
+    task = get_task_queue().get(task_id)
+    if task is None:
+        return None
+    status = {task_queue.QUEUED: QUEUED, task_queue.LEASED: RUNNING,
+              task_queue.DONE: DONE, task_queue.DEAD: FAILED}[task["status"]]
+    # A task waiting for a retry has run before: show it as running, with its last error
+    if status == QUEUED and task["attempts"]:
+        status = RUNNING
+    return {
+        "job_id": task_id,
+        "status": status,
+        "submitted_at": task["created_at"],
+        "started_at": task["started_at"],
+        "finished_at": task["finished_at"],
+        "attempts": task["attempts"],
+        "result": task["result"],
+        "error": task["error"],
+    }
+
+
+def store_results(exam_text, rubric, outcomes):
+    """
+    Persist a rubric and the successful gradings among `outcomes` (dicts with
+    grading_result and optionally student_id / student_text); each outcome
+    gets its grading_id. Storage problems never fail the correction itself.
+    Waits for the writes to be committed, so the ids returned to the client
+    can be fetched right away from /results.
+    """
+    store = get_result_store()
+    if store is None:
+        return None
+    try:
+        key = store.save_rubric(exam_text, rubric, model_name=get_ai_engine().model_name)
+        for outcome in outcomes:
+            if outcome.get("grading_result") is not None:
+                outcome["grading_id"] = store.save_grading(
+                    key, outcome["grading_result"],
+                    student_id=outcome.get("student_id"), student_text=outcome.pop("student_text", None)
+                )
+        store.flush()
+        return key
+    except Exception as e:
+        print(f"Could not store results: {e}")
+        return None
+
+
+def render_pdf_report(grading_data):
+    """Render the report in memory and return the PDF bytes (no filesystem involved)"""
     try:
-        # pdf_generator.test_with_various_structures will return the filename
-        result_path = pdf_generator.test_with_various_structures(grading_data, out_path)
-        return result_path
+        # Use SmartPDFGenerator which now accepts lists or dicts
+        return get_pdf_generator().generate_pdf(grading_data, None)
     except Exception:
         # Fallback simple FPDF dump (keeps existing minimal behavior) -- French labels
+        from fpdf import FPDF
+
         pdf = FPDF()
         pdf.add_page()
         pdf.set_font("Arial", size=12)
@@ -43,8 +176,98 @@ def create_pdf_report(grading_data, filename="report.pdf"):
         pdf.set_font("Arial", size=10)
         pdf.multi_cell(0, 10, txt=str(grading_data))
 
-        pdf.output(out_path)
-        return out_path
+        # fpdf returns a latin-1 str, fpdf2 a bytearray
+        output = pdf.output(dest='S')
+        return output.encode('latin-1') if isinstance(output, str) else bytes(output)
+
+
+def store_pdf_report(pdf_bytes, filename=None):
+    """
+    Persist PDF bytes inside the reports folder. Without an explicit filename the
+    name is derived from the content, so concurrent requests never overwrite each
+    other and identical reports are written once.
+    """
+    if filename is None:
+        filename = f"report_{hashlib.sha256(pdf_bytes).hexdigest()[:32]}.pdf"
+    out_path = os.path.join(get_reports_dir(), filename)
+    if not os.path.exists(out_path):
+        tmp_path = f"{out_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, out_path)
+    return out_path
+
+
+def create_pdf_report(grading_data, filename=None):
+    """Render and store a report, returning its path"""
+    return store_pdf_report(render_pdf_report(grading_data), filename)
+
+
+def model_unavailable(error):
+    # Shed load quickly while the model is failing; clients should retry later
+    response = jsonify({"error": str(error)})
+    response.status_code = 503
+    if error.retry_after:
+        response.headers['Retry-After'] = str(max(1, int(error.retry_after)))
+    return response
+
+
+def grade_copy(exam_text, student_text, force_regrade=False, student_id=None):
+    """Rubric extraction + grading (persisted in the result store), without any report"""
+    engine = get_ai_engine()
+    cache_info = {}
+
+    with metrics.collect_model_calls() as model_calls:
+        # 1. Extract Rubric
+        rubric = engine.extract_rubric(exam_text, cache_info=cache_info)
+
+        # 2. Grade Copy (force_regrade skips the grading cache)
+        grading_result = engine.grade_student(
+            rubric, student_text, use_cache=not force_regrade, cache_info=cache_info
+        )
+
+    result = {
+        "rubric_extracted": rubric,
+        "grading_result": grading_result,
+        "cache": cache_info,
+        # Tokens of the model calls this request made (none on cache hits): reported by the backend, else estimated
+        "tokens": metrics.token_usage(model_calls)
+    }
+    if engine.prescoring:
+        # Local keyword coverage and provisional score, alongside the model's grading
+        result["prescore"] = engine.prescore(rubric, student_text)
+    stored = {"grading_result": grading_result, "student_id": student_id, "student_text": student_text}
+    result["exam_hash"] = store_results(exam_text, rubric, [stored])
+    result["grading_id"] = stored.get("grading_id")
+    return result
+
+
+def run_correction(exam_text, student_text, filename=None, force_regrade=False, student_id=None):
+    """Full correction pipeline: rubric -> grading -> PDF report"""
+    result = grade_copy(exam_text, student_text, force_regrade=force_regrade, student_id=student_id)
+
+    # 3. Generate PDF (saved inside reports folder under a content-addressed name)
+    result["pdf_report_url"] = create_pdf_report(result["grading_result"], filename=filename)
+    return result
+
+
+def submit_correction_job(exam_text, student_text, force_regrade=False, student_id=None):
+    queue = get_task_queue()
+    if queue is not None:
+        # Graded by worker.py processes; survives a restart of the API
+        job_id = queue.enqueue("correct", {
+            "exam_text": exam_text, "student_text": student_text,
+            "force_regrade": force_regrade, "student_id": student_id
+        })
+    else:
+        job_id = job_manager.submit(
+            run_correction, exam_text, student_text, force_regrade=force_regrade, student_id=student_id
+        )
+    return jsonify({
+        "status": "accepted",
+        "job_id": job_id,
+        "status_url": url_for('get_job', job_id=job_id)
+    }), 202
 
 
 @app.route('/correct', methods=['POST'])
@@ -57,23 +280,512 @@ def correct_copy():
         if not exam_text or not student_text:
             return jsonify({"error": "Missing exam_text or student_text"}), 400
 
-        # 1. Extract Rubric
-        rubric = ai_engine.extract_rubric(exam_text)
+        force_regrade = bool(data.get('force_regrade'))
+
+        # Job mode: answer immediately, the client polls /jobs/<id>
+        if data.get('async') or request.args.get('async') in ('1', 'true'):
+            return submit_correction_job(exam_text, student_text, force_regrade=force_regrade,
+                                         student_id=data.get('student_id'))
+
+        # pdf: 'store' (default, persisted and linked), 'inline' (PDF streamed from memory) or 'none'
+        pdf_mode = data.get('pdf', 'store')
+        # timings: add the per-stage breakdown of this request (ms) to the response
+        want_timings = bool(data.get('timings')) or request.args.get('timings') in ('1', 'true')
+
+        with metrics.collect_timings() as timings, metrics.span('correct_request'):
+            result = grade_copy(exam_text, student_text, force_regrade=force_regrade,
+                                student_id=data.get('student_id'))
+
+            if pdf_mode == 'inline':
+                pdf_bytes = render_pdf_report(result["grading_result"])
+            elif pdf_mode != 'none':
+                result["pdf_report_url"] = create_pdf_report(result["grading_result"])
+                result["pdf_download_url"] = url_for('download_report',
+                                                     filename=os.path.basename(result["pdf_report_url"]))
+
+        if pdf_mode == 'inline':
+            response = send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf', download_name='report.pdf')
+            if want_timings:
+                response.headers['Server-Timing'] = ", ".join(
+                    f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+                )
+            return response
+        if want_timings:
+            result["timings_ms"] = {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
+
+        return jsonify({"status": "success", **result})
+
+    except CircuitOpenError as e:
+        return model_unavailable(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def max_concurrency_param(value):
+    """Optional max_concurrency of a request: None or a positive int (digits from a form field too)"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError("max_concurrency must be a positive integer")
+    return value
+
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/correct/stream', methods=['POST'])
+def correct_stream():
+    """
+    Server-sent events version of /correct: 'rubric' once extracted, 'prescore'
+    (instant provisional score from local keyword coverage), one 'item'
+    per graded rubric item as soon as the model has written it, then 'result'
+    with the total score and the PDF link ('error' if anything fails).
+    """
+    data = request.json or {}
+    exam_text = data.get('exam_text')
+    student_text = data.get('student_text')
+
+    if not exam_text or not student_text:
+        return jsonify({"error": "Missing exam_text or student_text"}), 400
+
+    force_regrade = bool(data.get('force_regrade'))
+    student_id = data.get('student_id')
+
+    def events():
+        cache_info = {}
+        try:
+            engine = get_ai_engine()
+            rubric = engine.extract_rubric(exam_text, cache_info=cache_info)
+            yield sse_event("rubric", rubric)
+            if engine.prescoring:
+                yield sse_event("prescore", engine.prescore(rubric, student_text))
+
+            grading_result = None
+            for kind, payload in engine.grade_student_stream(
+                    rubric, student_text, use_cache=not force_regrade, cache_info=cache_info):
+                if kind == 'item':
+                    yield sse_event("item", payload)
+                else:
+                    grading_result = payload
+
+            stored = {"grading_result": grading_result, "student_id": student_id, "student_text": student_text}
+            store_results(exam_text, rubric, [stored])
+            filename = os.path.basename(create_pdf_report(grading_result))
+            total_score = grading_result.get('total_score') if isinstance(grading_result, dict) else None
+            yield sse_event("result", {
+                "total_score": total_score,
+                "grading_result": grading_result,
+                "grading_id": stored.get("grading_id"),
+                "pdf_report_url": url_for('download_report', filename=filename),
+                "cache": cache_info
+            })
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/correct/upload', methods=['POST'])
+def correct_upload():
+    """
+    Grade a whole class from one uploaded PDF bundle (multipart field 'file',
+    plus 'exam_text'). Pages are parsed one at a time and cut into student
+    copies (see pdf_bundle); each copy is graded as soon as it is complete,
+    while the rest of the bundle is still being read. Server-sent events:
+    'rubric', then one 'copy' per graded copy (completion order), then 'done'.
+    Optional form fields: pages_per_copy, boundary_pattern, max_concurrency, force_regrade.
+    """
+    exam_text = request.form.get('exam_text')
+    bundle = request.files.get('file')
+
+    if not exam_text or bundle is None:
+        return jsonify({"error": "Missing exam_text or file (PDF bundle)"}), 400
+
+    pages_per_copy = request.form.get('pages_per_copy', type=int)
+    boundary_pattern = request.form.get('boundary_pattern') or None
+    try:
+        max_concurrency = max_concurrency_param(request.form.get('max_concurrency'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    force_regrade = request.form.get('force_regrade', '').lower() in ('1', 'true', 'yes')
+
+    # The upload may be closed once the view returns: spool it to disk (not memory) for the stream
+    spooled = tempfile.TemporaryFile()
+    shutil.copyfileobj(bundle.stream, spooled)
+
+    def events():
+        import pdf_bundle
+
+        graded = failed = 0
+        try:
+            engine = get_ai_engine()
+            cache_info = {}
+            rubric = engine.extract_rubric(exam_text, cache_info=cache_info)
+            yield sse_event("rubric", rubric)
+
+            # Copies being graded (with their text, stored for later regrades); dropped once graded
+            copies_info = {}
+
+            def copy_texts():
+                pages = pdf_bundle.iter_pdf_pages(spooled)
+                for student_copy in pdf_bundle.iter_student_copies(pages, pages_per_copy, boundary_pattern):
+                    copies_info[student_copy["index"]] = student_copy
+                    yield student_copy["text"]
+
+            for outcome in engine.grade_stream(rubric, copy_texts(), max_concurrency=max_concurrency,
+                                               use_cache=not force_regrade):
+                info = copies_info.pop(outcome["index"], {})
+                text = info.pop("text", None)
+                outcome.update(info)
+                if outcome["status"] == "success":
+                    graded += 1
+                    outcome["student_id"] = outcome.get("student")
+                    # Popped again by store_results: the event does not echo the copy
+                    outcome["student_text"] = text
+                    store_results(exam_text, rubric, [outcome])
+                    try:
+                        filename = os.path.basename(create_pdf_report(outcome["grading_result"]))
+                        outcome["pdf_report_url"] = url_for('download_report', filename=filename)
+                    except Exception as e:
+                        outcome["pdf_error"] = str(e)
+                else:
+                    failed += 1
+                yield sse_event("copy", outcome)
+
+            yield sse_event("done", {"graded": graded, "failed": failed, "cache": {"rubric": cache_info.get("rubric")}})
+        except Exception as e:
+            yield sse_event("error", {"error": str(e), "graded": graded, "failed": failed})
+        finally:
+            spooled.close()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latency histograms and model/cache counters, in Prometheus text format"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/reports/<path:filename>', methods=['GET'])
+def download_report(filename):
+    return send_from_directory(get_reports_dir(), filename, mimetype='application/pdf', as_attachment=True)
+
+
+@app.route('/results', methods=['GET'])
+def list_results():
+    """
+    Stored gradings, oldest first, filtered by ?exam_hash= and/or ?student_id=.
+    Paginated: ?limit= (default 50) and ?cursor= taken from the previous page's next_cursor.
+    """
+    store = get_result_store()
+    if store is None:
+        return jsonify({"error": "Result store disabled"}), 404
+    try:
+        return jsonify(store.list_gradings(
+            exam_hash=request.args.get('exam_hash'),
+            student_id=request.args.get('student_id'),
+            since=request.args.get('since', type=float),
+            limit=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor'),
+            include_results=request.args.get('full') in ('1', 'true')
+        ))
+    except InvalidCursorError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/results/<grading_id>', methods=['GET'])
+def get_result(grading_id):
+    store = get_result_store()
+    record = store.get_grading(grading_id) if store is not None else None
+    if record is None:
+        return jsonify({"error": "Unknown grading"}), 404
+    return jsonify(record)
+
+
+@app.route('/results/<grading_id>/pdf', methods=['GET'])
+def download_result_pdf(grading_id):
+    """Re-render a stored grading's report from its JSON, without calling the model"""
+    store = get_result_store()
+    record = store.get_grading(grading_id) if store is not None else None
+    if record is None:
+        return jsonify({"error": "Unknown grading"}), 404
+    return send_file(io.BytesIO(render_pdf_report(record["grading_result"])), mimetype='application/pdf',
+                     as_attachment=True, download_name=f"report_{grading_id}.pdf")
+
+
+@app.route('/exams/<exam_hash>/rubric', methods=['GET'])
+def get_exam_rubric(exam_hash):
+    store = get_result_store()
+    rubric = store.get_rubric(exam_hash) if store is not None else None
+    if rubric is None:
+        return jsonify({"error": "Unknown exam"}), 404
+    return jsonify({"exam_hash": exam_hash, "rubric": rubric})
+
+
+@app.route('/exams/<exam_hash>/scores', methods=['GET'])
+def get_exam_scores(exam_hash):
+    """Per-question scores of a whole class (?question_id=Q3 for one question), paginated like /results"""
+    store = get_result_store()
+    if store is None:
+        return jsonify({"error": "Result store disabled"}), 404
+    try:
+        return jsonify(store.question_scores(
+            exam_hash,
+            question_id=request.args.get('question_id'),
+            limit=request.args.get('limit', type=int),
+            cursor=request.args.get('cursor')
+        ))
+    except InvalidCursorError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/exams/<exam_hash>/regrade', methods=['POST'])
+def regrade_exam(exam_hash):
+    """
+    Apply a corrected rubric ({"rubric": ...}) to every stored copy of an exam.
+    Only the changed or added rubric items are regraded; the other scores are
+    reused. Pass exam_text as well so later corrections of the same exam use the fix.
+    Copies stored without their text are listed under 'skipped' (409 when that is all of them).
+    """
+    try:
+        data = request.json or {}
+        new_rubric = data.get('rubric')
+        store = get_result_store()
+        if store is None:
+            return jsonify({"error": "Result store disabled"}), 404
+        old_rubric = store.get_rubric(exam_hash)
+        if old_rubric is None:
+            return jsonify({"error": "Unknown exam"}), 404
+        if not isinstance(new_rubric, (dict, list)) or not new_rubric:
+            return jsonify({"error": "Missing rubric"}), 400
+        try:
+            max_concurrency = max_concurrency_param(data.get('max_concurrency'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        engine = get_ai_engine()
+        diff = diff_rubrics(old_rubric, new_rubric)
+        copies, skipped = [], []
+        for record, text in store.current_gradings(exam_hash):
+            if text is None:
+                # Stored without its copy text: there is nothing to send to the model
+                skipped.append({"grading_id": record["grading_id"], "student_id": record["student_id"],
+                                "error": "Copy text not stored"})
+            else:
+                copies.append((record, text))
+        if skipped and not copies:
+            return jsonify({"error": "No stored copy text to regrade", "skipped": skipped}), 409
+
+        with metrics.collect_model_calls() as model_calls:
+            results = engine.regrade_many(
+                old_rubric, new_rubric,
+                [text for _, text in copies], [record["grading_result"] for record, _ in copies],
+                max_concurrency=max_concurrency
+            )
+
+        store.update_rubric(exam_hash, new_rubric, model_name=engine.model_name)
+        if data.get('exam_text'):
+            engine.rubric_cache.set(rubric_cache_key(data['exam_text'], engine.model_name), new_rubric)
+        for result, (record, text) in zip(results, copies):
+            result["previous_grading_id"] = record["grading_id"]
+            result["student_id"] = record["student_id"]
+            if result["status"] == "success":
+                result["grading_id"] = store.save_grading(
+                    exam_hash, result["grading_result"], student_id=record["student_id"],
+                    student_text=text, replaces=record["grading_id"]
+                )
+        store.flush()
+
+        return jsonify({
+            "status": "success",
+            "exam_hash": exam_hash,
+            "diff": diff,
+            "regraded": sum(1 for r in results if r["status"] == "success"),
+            "failed": sum(1 for r in results if r["status"] == "error"),
+            "items_sent_to_model": sum(r.get("regraded_items", 0) for r in results),
+            "tokens": metrics.token_usage(model_calls),
+            "results": results,
+            "skipped": skipped
+        })
+
+    except CircuitOpenError as e:
+        return model_unavailable(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def exam_analytics(store, exam_hash, level='question'):
+    """Class summary of an exam from the result store (None when nothing is stored for it)"""
+    import analytics
+
+    if level == 'criterion':
+        # Criteria only live in the full grading JSON
+        gradings, cursor = [], None
+        while True:
+            page = store.list_gradings(exam_hash=exam_hash, limit=1000, cursor=cursor, include_results=True)
+            gradings.extend(record["grading_result"] for record in page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        if not gradings:
+            return None
+        return analytics.ClassAnalytics.from_gradings(gradings, level='criterion').summary()
+
+    grading_ids, question_ids, scores, max_points = store.score_columns(exam_hash)
+    if not grading_ids:
+        return None
+    return analytics.ClassAnalytics.from_columns(grading_ids, question_ids, scores, max_points).summary()
+
+
+@app.route('/exams/<exam_hash>/analytics', methods=['GET'])
+def get_exam_analytics(exam_hash):
+    """Class statistics per question (?level=criterion for grading_breakdown criteria); ?format=pdf for the report"""
+    store = get_result_store()
+    if store is None:
+        return jsonify({"error": "Result store disabled"}), 404
+    summary = exam_analytics(store, exam_hash, level=request.args.get('level', 'question'))
+    if summary is None:
+        return jsonify({"error": "No gradings stored for this exam"}), 404
+
+    if request.args.get('format') == 'pdf':
+        pdf_bytes = get_pdf_generator().generate_class_report(summary, None)
+        return send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf', as_attachment=True,
+                         download_name=f"class_report_{exam_hash[:12]}.pdf")
+    return jsonify({"exam_hash": exam_hash, **summary})
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    data = request.json or {}
+    exam_text = data.get('exam_text')
+    student_text = data.get('student_text')
+
+    if not exam_text or not student_text:
+        return jsonify({"error": "Missing exam_text or student_text"}), 400
+
+    return submit_correction_job(exam_text, student_text, force_regrade=bool(data.get('force_regrade')),
+                                 student_id=data.get('student_id'))
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = queued_job(job_id) if get_task_queue() is not None else job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    if job["status"] == DONE:
+        job["pdf_download_url"] = url_for('download_job_pdf', job_id=job_id)
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/pdf', methods=['GET'])
+def download_job_pdf(job_id):
+    job = queued_job(job_id) if get_task_queue() is not None else job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] != DONE:
+        return jsonify({"error": f"Job is {job['status']}", "status": job["status"]}), 409
+    if "pdf_report_url" not in job["result"]:
+        # Queue workers may run on other hosts: the report is rendered here from the grading JSON
+        return send_file(io.BytesIO(render_pdf_report(job["result"]["grading_result"])),
+                         mimetype='application/pdf', as_attachment=True, download_name=f"report_{job_id}.pdf")
+
+    pdf_path = job["result"]["pdf_report_url"]
+    if not os.path.exists(pdf_path):
+        return jsonify({"error": "Report file no longer available"}), 410
+    return send_file(pdf_path, mimetype='application/pdf', as_attachment=True,
+                     download_name=f"report_{job_id}.pdf")
+
+
+@app.route('/correct/batch', methods=['POST'])
+def correct_batch():
+    try:
+        data = request.json
+        exam_text = data.get('exam_text')
+        student_texts = data.get('student_texts')
+
+        if not exam_text or not isinstance(student_texts, list) or not student_texts:
+            return jsonify({"error": "Missing exam_text or student_texts (non-empty list)"}), 400
+        try:
+            max_concurrency = max_concurrency_param(data.get('max_concurrency'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # 1. Extract Rubric once for the whole batch
+        engine = get_ai_engine()
+        cache_info = {}
+        with metrics.collect_model_calls() as model_calls:
+            rubric = engine.extract_rubric(exam_text, cache_info=cache_info)
+
+            # 2. Grade all copies concurrently (order preserved, failures isolated),
+            #    optionally packing several copies per model call
+            results = engine.grade_many(
+                rubric, student_texts,
+                max_concurrency=max_concurrency,
+                batched=bool(data.get('batched')),
+                use_cache=not data.get('force_regrade')
+            )
+        # Optional student_ids, parallel to student_texts, are kept in the result store
+        student_ids = data.get('student_ids') if isinstance(data.get('student_ids'), list) else []
+        for result in results:
+            if result["status"] == "success":
+                result["student_text"] = student_texts[result["index"]]
+                if result["index"] < len(student_ids):
+                    result["student_id"] = student_ids[result["index"]]
+        exam_key = store_results(exam_text, rubric, results)
+        for result in results:
+            result.pop("student_text", None)
 
-        # 2. Grade Copy
-        grading_result = ai_engine.grade_student(rubric, student_text)
-        print(grading_result)
+        # 3. Generate one PDF per successfully graded copy, rendered across processes
+        batch_id = uuid.uuid4().hex[:12]
+        graded = [r for r in results if r["status"] == "success"]
+        filenames = [f"report_{batch_id}_{r['index'] + 1}.pdf" for r in graded]
+        import pdf_generator
 
-        # 3. Generate PDF (saved inside reports folder)
-        pdf_path = create_pdf_report(grading_result, filename="report.pdf")
+        rendered = pdf_generator.generate_many(
+            [r["grading_result"] for r in graded], get_reports_dir(), filenames=filenames
+        )
+        for result, filename, report in zip(graded, filenames, rendered):
+            if report["error"] is None:
+                result["pdf_report_url"] = report["path"]
+            else:
+                # Same minimal FPDF fallback as the single-copy path
+                try:
+                    result["pdf_report_url"] = create_pdf_report(result["grading_result"], filename=filename)
+                except Exception as e:
+                    result["pdf_error"] = str(e)
 
         return jsonify({
             "status": "success",
+            "batch_id": batch_id,
+            "exam_hash": exam_key,
             "rubric_extracted": rubric,
-            "grading_result": grading_result,
-            "pdf_report_url": pdf_path
+            "graded": sum(1 for r in results if r["status"] == "success"),
+            "failed": sum(1 for r in results if r["status"] == "error"),
+            "cache": {
+                "rubric": cache_info.get("rubric"),
+                "grading_hits": sum(1 for r in results if r.get("cache") == "hit"),
+                "grading_misses": sum(1 for r in results if r.get("cache") in ("miss", "bypass"))
+            },
+            "tokens": metrics.token_usage(model_calls),
+            "results": results
         })
 
+    except CircuitOpenError as e:
+        return model_unavailable(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,481 @@
+"""
+End-to-end performance benchmarks for the correction pipeline.
+
+Runs entirely on the local fake model backend (no network, no API key) and
+writes machine-readable JSON so results can be compared between commits:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The benchmark must never hit the live API nor reuse a warm on-disk cache
+os.environ.setdefault("MODEL_BACKEND", "fake")
+_cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+os.environ.setdefault("RUBRIC_CACHE_DIR", os.path.join(_cache_dir, "rubrics"))
+os.environ.setdefault("GRADING_CACHE_PATH", os.path.join(_cache_dir, "gradings.sqlite3"))
+os.environ.setdefault("RESULT_STORE_PATH", os.path.join(_cache_dir, "results.sqlite3"))
+
+from core_logic import (AutoCorrectAI, MemoryCache, TieredCache, ModelClient, QuotaLimiter, estimate_tokens,
+                        get_prompt_builder)
+from model_backends import FakeBackend
+from pdf_generator import SmartPDFGenerator, generate_many
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(durations, wall_time=None):
+    """Latency summary in milliseconds (plus throughput when wall time is known)"""
+    values = sorted(durations)
+    summary = {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0,
+    }
+    if wall_time:
+        summary["wall_s"] = wall_time
+        summary["rps"] = len(values) / wall_time
+    return summary
+
+
+def time_calls(func, iterations):
+    durations = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(i)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+# ---------------------------------------------------------------------------
+# Synthetic inputs
+# ---------------------------------------------------------------------------
+
+def make_exam(num_questions=5):
+    lines = ["Examen de mathématiques - Session principale", ""]
+    for q in range(1, num_questions + 1):
+        lines.append(f"Question {q} ({2 + q % 4} points) : Démontrer la propriété de continuité "
+                     f"et calculer la dérivée de la fonction polynomiale numéro {q}.")
+    return "\n".join(lines)
+
+
+def make_student_copy(num_questions=5, answer_chars=400, variant=0):
+    base = ("La fonction est continue car polynomiale. Sa dérivée se calcule terme par terme, "
+            "et la propriété demandée découle de la linéarité. ")
+    parts = []
+    for q in range(1, num_questions + 1):
+        text = (f"Réponse {q} (copie {variant}) : " + base * (answer_chars // len(base) + 1))[:answer_chars]
+        parts.append(text)
+    return "\n\n".join(parts)
+
+
+def make_grading_result(num_questions=5, answer_chars=400, criteria=3):
+    corrections = []
+    for q in range(1, num_questions + 1):
+        answer = make_student_copy(1, answer_chars, variant=q)
+        corrections.append({
+            "question_id": f"Question {q}",
+            "topic": "Analyse - dérivées et continuité",
+            "max_points": 5 * criteria,
+            "student_score": 3 * criteria,
+            "student_answer": "\n".join(answer[i:i + 120] for i in range(0, len(answer), 120)),
+            "grading_breakdown": [
+                {
+                    "element": f"Critère {c + 1} de la question {q}",
+                    "max_points": 5,
+                    "score": 3,
+                    "justification": "La démarche est correcte mais la justification de la linéarité "
+                                     "n'est pas explicitement énoncée dans la copie."
+                }
+                for c in range(criteria)
+            ],
+            "overall_feedback": "Bon travail, pensez à citer les propriétés utilisées."
+        })
+    return {"corrections": corrections}
+
+
+def make_verbose_rubric(num_questions=5):
+    """A rubric as chatty models return it: scoring fields plus metadata the grader never needs"""
+    items = []
+    for q in range(1, num_questions + 1):
+        items.append({
+            "question_id": f"Q{q}",
+            "topic": f"Démontrer la propriété de continuité et calculer la dérivée de la fonction numéro {q}.",
+            "max_points": float(2 + q % 4),
+            "key_elements": ["continuité", "dérivée", "linéarité", f"fonction polynomiale {q}"],
+            "difficulty": "moyenne",
+            "bloom_level": "application",
+            "estimated_time_minutes": 10.0,
+            "chapter": "Analyse - dérivées et continuité",
+            "notes": "Accepter toute démonstration rigoureuse, même si elle diffère du corrigé.",
+        })
+    return {
+        "exam_title": "Examen de mathématiques - Session principale",
+        "rubric": items,
+        "total_points": float(sum(item["max_points"] for item in items)),
+        "generated_by": "rubric extraction",
+    }
+
+
+def legacy_grading_prompt(rubric_json, student_copy):
+    """The grading prompt before compact rubric encoding, kept as the benchmark baseline"""
+    return f"""
+        Act as a strict but fair academic grader. 
+
+        INPUT DATA:
+        1. RUBRIC (JSON): {json.dumps(rubric_json)}
+        2. STUDENT COPY: {student_copy}
+        
+        INSTRUCTIONS:
+        - Go through the rubric item by item.
+        - Compare the student's answer to the "expected elements".
+        - Assign a score for each item (do not exceed max points).
+        - Provide a justification for the score (mention missing keywords or logic errors).
+        - Calculate the final total score.
+
+        Output valid JSON.
+        """
+
+
+def make_engine(latency=0.0, jitter=0.0, error_rate=0.0):
+    # Memory-only caches so runs stay independent of each other, and no quota
+    # throttling: the benchmark measures our code, not the rate limiter
+    backend = FakeBackend(latency=latency, jitter=jitter, error_rate=error_rate)
+    return AutoCorrectAI(
+        backend=backend,
+        rubric_cache=TieredCache(memory=MemoryCache()),
+        grading_cache=TieredCache(memory=MemoryCache()),
+        client=ModelClient(backend, limiter=QuotaLimiter(requests_per_minute=0), base_delay=0.05)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+def bench_extract_rubric(args):
+    engine = make_engine(latency=args.latency, jitter=args.jitter)
+    exam = make_exam(args.questions)
+    cold = time_calls(lambda i: engine.extract_rubric(exam, use_cache=False), args.iterations)
+    warm = time_calls(lambda i: engine.extract_rubric(exam), args.iterations)
+    return {"cold": summarize(cold), "cached": summarize(warm)}
+
+
+def bench_grade_student(args):
+    engine = make_engine(latency=args.latency, jitter=args.jitter)
+    rubric = engine.extract_rubric(make_exam(args.questions))
+    copies = [make_student_copy(args.questions, args.answer_chars, variant=i) for i in range(args.iterations)]
+    return summarize(time_calls(lambda i: engine.grade_student(rubric, copies[i]), args.iterations))
+
+
+def bench_grade_batched(args):
+    """Model calls and wall time for a class: one call per copy versus packed prompts"""
+    results = {}
+    for batched in (False, True):
+        engine = make_engine(latency=args.latency, jitter=args.jitter)
+        rubric = engine.extract_rubric(make_exam(args.questions))
+        copies = [make_student_copy(args.questions, args.answer_chars, variant=i) for i in range(args.reports)]
+        engine.backend.calls = 0
+        start = time.perf_counter()
+        engine.grade_many(rubric, copies, batched=batched)
+        results["batched" if batched else "single"] = {
+            "copies": len(copies),
+            "model_calls": engine.backend.calls,
+            "wall_ms": (time.perf_counter() - start) * 1000,
+        }
+    return results
+
+
+def bench_generate_pdf(args):
+    generator = SmartPDFGenerator()
+    data = make_grading_result(args.questions, args.answer_chars)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.pdf")
+        return summarize(time_calls(lambda i: generator.generate_pdf(data, path), args.iterations))
+
+
+def bench_pdf_renderers(args):
+    """platypus (reference) versus the direct-canvas fast renderer, same data"""
+    generator = SmartPDFGenerator()
+    data = make_grading_result(args.questions, args.answer_chars)
+    results = {}
+    for renderer in ("platypus", "fast"):
+        results[renderer] = summarize(time_calls(lambda i: generator.generate_pdf(data, None, renderer=renderer),
+                                                 args.iterations))
+    results["speedup"] = results["platypus"]["mean_ms"] / results["fast"]["mean_ms"]
+    return results
+
+
+def bench_pdf_scaling(args):
+    """PDF render time as question count and answer length grow"""
+    generator = SmartPDFGenerator()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scaling.pdf")
+        for num_questions in (1, 5, 20, 50):
+            for answer_chars in (200, 2000, 8000):
+                data = make_grading_result(num_questions, answer_chars)
+                durations = time_calls(lambda i: generator.generate_pdf(data, path), max(1, args.iterations // 5))
+                results.append({
+                    "questions": num_questions,
+                    "answer_chars": answer_chars,
+                    **summarize(durations)
+                })
+    return results
+
+
+def bench_generate_many(args):
+    """Class-sized report rendering: single process versus one worker per core"""
+    data = [make_grading_result(args.questions, args.answer_chars) for _ in range(args.reports)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in sorted({1, os.cpu_count() or 1}):
+            start = time.perf_counter()
+            rendered = generate_many(data, tmp, max_workers=workers)
+            wall = time.perf_counter() - start
+            results[f"workers_{workers}"] = summarize([r["seconds"] for r in rendered], wall_time=wall)
+    return results
+
+
+def bench_correct_endpoint(args):
+    """p50/p95/p99 and requests/s of POST /correct under concurrent clients"""
+    import app
+
+    app.ai_engine = make_engine(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    client_app = app.app
+    exam = make_exam(args.questions)
+    # 'inline': the report is still rendered (and timed) but never written to the repo's reports/
+    payloads = [{"exam_text": exam, "student_text": make_student_copy(args.questions, args.answer_chars, i),
+                 "pdf": "inline"}
+                for i in range(args.requests)]
+
+    def one_request(payload):
+        with client_app.test_client() as client:
+            start = time.perf_counter()
+            response = client.post('/correct', json=payload)
+            return time.perf_counter() - start, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        outcomes = list(executor.map(one_request, payloads))
+    wall = time.perf_counter() - start
+
+    summary = summarize([d for d, _ in outcomes], wall_time=wall)
+    summary["clients"] = args.clients
+    summary["errors"] = sum(1 for _, status in outcomes if status != 200)
+    return summary
+
+
+def bench_cold_start(args):
+    """
+    Import time of the app and core modules in a fresh interpreter, without
+    credentials, plus the slowest imports reported by `python -X importtime`.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_API_KEY", "MODEL_BACKEND")}
+    results = {}
+    for module in ("app", "core_logic", "pdf_generator"):
+        durations = []
+        for _ in range(max(1, args.iterations // 4)):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", f"import {module}"], cwd=here, env=env,
+                           check=True, capture_output=True)
+            durations.append(time.perf_counter() - start)
+        results[module] = summarize(durations)
+
+    profile = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=here, env=env,
+                             check=True, capture_output=True, text=True).stderr
+    imports = []
+    for line in profile.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            imports.append((int(parts[1]), parts[2].strip()))
+    results["slowest_imports_us"] = [{"module": name, "cumulative_us": us} for us, name in sorted(imports)[-10:][::-1]]
+    return results
+
+
+def bench_class_analytics(args):
+    """Class statistics over --copies gradings: loading the JSON results, then the vectorized summary"""
+    import random
+    from analytics import ClassAnalytics
+
+    rnd = random.Random(0)
+    template = make_grading_result(args.questions, 50)
+    gradings = [
+        {"corrections": [dict(item, student_score=rnd.randint(0, int(item["max_points"])))
+                         for item in template["corrections"]]}
+        for _ in range(args.copies)
+    ]
+    iterations = max(1, args.iterations // 5)
+    loaded = ClassAnalytics.from_gradings(gradings)
+    return {
+        "copies": args.copies,
+        "from_gradings": summarize(time_calls(lambda i: ClassAnalytics.from_gradings(gradings), iterations)),
+        "summary": summarize(time_calls(lambda i: loaded.summary(), iterations)),
+    }
+
+
+def bench_prompt_encoding(args):
+    """
+    Grading prompt size, build time and model latency: the verbose json.dumps
+    rubric prompt (legacy) versus the compact precompiled one. The fake model
+    pays --prefill-latency seconds per 1000 prompt tokens.
+    """
+    rubric = make_verbose_rubric(args.questions)
+    copies = [make_student_copy(args.questions, args.answer_chars, variant=i) for i in range(args.iterations)]
+    compiled = get_prompt_builder(rubric)
+    builders = {
+        "legacy": lambda copy: legacy_grading_prompt(rubric, copy),
+        "compact": compiled.build,
+    }
+    results = {}
+    for name, build in builders.items():
+        backend = FakeBackend(latency=args.latency, prompt_token_latency=args.prefill_latency)
+        client = ModelClient(backend, limiter=QuotaLimiter(requests_per_minute=0))
+        prompts = [build(copy) for copy in copies]
+        build_times = time_calls(lambda i: build(copies[i]), args.iterations)
+        call_times = time_calls(lambda i: client.generate_json(
+            prompts[i], task='grading', context={"rubric": rubric, "student_copy": copies[i]}
+        ), args.iterations)
+        results[name] = {
+            "rubric_tokens": estimate_tokens(json.dumps(rubric) if name == "legacy" else compiled.rubric_text),
+            "prompt_tokens_mean": sum(estimate_tokens(p) for p in prompts) / len(prompts),
+            "build_us_mean": sum(build_times) / len(build_times) * 1e6,
+            "model_call": summarize(call_times),
+        }
+    legacy, compact = results["legacy"], results["compact"]
+    results["prompt_token_reduction"] = 1 - compact["prompt_tokens_mean"] / legacy["prompt_tokens_mean"]
+    results["rubric_token_reduction"] = 1 - compact["rubric_tokens"] / legacy["rubric_tokens"]
+    results["latency_reduction"] = 1 - compact["model_call"]["mean_ms"] / legacy["model_call"]["mean_ms"] \
+        if legacy["model_call"]["mean_ms"] else 0.0
+    return results
+
+
+BENCHMARKS = {
+    "extract_rubric": bench_extract_rubric,
+    "grade_student": bench_grade_student,
+    "grade_batched": bench_grade_batched,
+    "generate_pdf": bench_generate_pdf,
+    "pdf_renderers": bench_pdf_renderers,
+    "pdf_scaling": bench_pdf_scaling,
+    "generate_many": bench_generate_many,
+    "correct_endpoint": bench_correct_endpoint,
+    "cold_start": bench_cold_start,
+    "class_analytics": bench_class_analytics,
+    "prompt_encoding": bench_prompt_encoding,
+}
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=""):
+    """Flatten nested results to {'bench.sub.p95_ms': value} for comparisons"""
+    flat = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(results, list):
+        for i, value in enumerate(results):
+            flat.update(flatten(value, f"{prefix}{i}."))
+    elif isinstance(results, (int, float)) and prefix.endswith(("_ms.", "rps.")):
+        flat[prefix[:-1]] = results
+    return flat
+
+
+def compare(current, baseline_path, threshold=0.10):
+    """Print metrics that moved by more than `threshold` versus a previous run"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    old = flatten(baseline["results"])
+    new = flatten(current["results"])
+    regressions = 0
+    print(f"\nComparison with {baseline_path} ({baseline.get('git_revision')}):")
+    for key in sorted(set(old) & set(new)):
+        if not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        # Higher is better for throughput, lower is better for latency
+        worse = change < -threshold if key.endswith("rps") else change > threshold
+        if abs(change) > threshold:
+            marker = "REGRESSION" if worse else "improved"
+            regressions += worse
+            print(f"  {marker:10s} {key}: {old[key]:.2f} -> {new[key]:.2f} ({change:+.1%})")
+    print(f"  {regressions} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoCorrectGPT performance benchmarks (fake backend)")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100, help="requests for the /correct benchmark")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients for /correct")
+    parser.add_argument("--reports", type=int, default=40, help="reports for the generate_many benchmark")
+    parser.add_argument("--copies", type=int, default=50000, help="graded copies for the class_analytics benchmark")
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--answer-chars", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="fake model latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake model error rate (0-1)")
+    parser.add_argument("--prefill-latency", type=float, default=0.05,
+                        help="fake model seconds per 1000 prompt tokens (prompt_encoding benchmark)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change reported by --compare")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.only or list(BENCHMARKS):
+        print(f"Running {name}...")
+        results[name] = BENCHMARKS[name](args)
+
+    report = {
+        "git_revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        return 1 if compare(report, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,1089 @@
 import os
-import google.generativeai as genai
 import json
+import hashlib
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from functools import lru_cache
 import typing_extensions as typing
 from dotenv import load_dotenv
+import metrics
+from model_backends import create_backend, DEFAULT_GEMINI_MODEL
 
 load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
 
-if not api_key:
-    raise ValueError("API Key not found! Make sure you created a .env file.")
+DEFAULT_MODEL_NAME = DEFAULT_GEMINI_MODEL
+GRADING_CONCURRENCY = int(os.getenv("GRADING_CONCURRENCY", "8"))
+# Batched grading: how many copies may share one prompt
+GRADING_BATCH_TOKEN_BUDGET = int(os.getenv("GRADING_BATCH_TOKEN_BUDGET", "30000"))
+GRADING_BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("GRADING_BATCH_MAX_OUTPUT_TOKENS", "8192"))
+GRADING_BATCH_MAX_SIZE = int(os.getenv("GRADING_BATCH_MAX_SIZE", "10"))
+# Model client limits, sized to the API quota
+MODEL_REQUESTS_PER_MINUTE = float(os.getenv("MODEL_REQUESTS_PER_MINUTE", "1000"))
+MODEL_MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "16"))
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+RUBRIC_CACHE_DIR = os.getenv(
+    "RUBRIC_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "rubrics")
+)
+GRADING_CACHE_PATH = os.getenv(
+    "GRADING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "gradings.sqlite3")
+)
+# Bump whenever the grading prompt changes so stale cached gradings are not reused
+GRADING_PROMPT_VERSION = "3"
+# Local keyword pre-scoring (see prescoring.py): blank copies skip the model, others get coverage hints
+PRESCORING = os.getenv("PRESCORING", "1") not in ("0", "false", "no")
+# Compiled grading prompts kept per rubric (a class shares one rubric)
+PROMPT_BUILDER_CACHE_SIZE = 64
+# Sectioned rubric extraction: exams longer than this are split on question boundaries
+SECTIONED_RUBRIC_MIN_CHARS = int(os.getenv("SECTIONED_RUBRIC_MIN_CHARS", "20000"))
+SECTIONED_RUBRIC_SECTION_CHARS = int(os.getenv("SECTIONED_RUBRIC_SECTION_CHARS", "12000"))
+# How much of the exam header (instructions, barème) is repeated in every section prompt
+SECTION_PREAMBLE_CHARS = 2000
 
-genai.configure(api_key=api_key)
+QUESTION_HEADING_PATTERN = re.compile(
+    r'(?im)^[ \t]*(?:question|exercice|exercise|probl[eè]me|problem|q)[ \t]*[\.:#-]?[ \t]*(\d+)\b'
+)
+QUESTION_ID_PREFIX_PATTERN = re.compile(r'^(?:question|exercice|exercise|q)\s*[\.:#-]?\s*')
+POINTS_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(?:points?|pts?)\b', re.IGNORECASE)
+STATED_TOTAL_PATTERN = re.compile(
+    r'(?i)(?:not[ée]e?\s+sur|bar[èe]me\s*(?:total)?\s*[:=]?\s*(?:sur)?|total\s*(?:des\s+points)?\s*[:=]?)'
+    r'\s*(\d+(?:[.,]\d+)?)'
+)
 
 
-class AutoCorrectAI:
+def normalize_text(text):
+    """Normalize text so that cosmetic differences do not change cache keys"""
+    text = unicodedata.normalize('NFC', str(text))
+    # Collapse runs of whitespace (CRLF vs LF, trailing spaces, indentation)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token), good enough for budgeting prompts"""
+    return (len(str(text)) + 3) // 4
+
+
+def rubric_cache_key(exam_text, model_name):
+    """Content-addressed key for a rubric: hash of normalized exam text + model name"""
+    payload = f"{model_name}\n{normalize_text(exam_text)}".encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def grading_cache_key(rubric_json, student_copy, model_name, prompt_version=GRADING_PROMPT_VERSION):
+    """Key for a grading: canonical rubric JSON + normalized student copy + prompt version + model"""
+    canonical_rubric = json.dumps(rubric_json, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    payload = f"{prompt_version}\n{model_name}\n{canonical_rubric}\n{normalize_text(student_copy)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def to_number(value):
+    """First number found in a value ('5', 5, '2,5 pts'...), or None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r'-?\d+(?:[.,]\d+)?', str(value))
+    return float(match.group().replace(',', '.')) if match else None
+
+
+def split_exam_sections(exam_text):
+    """
+    Split an exam paper on its question headings ("Question 3", "Exercice 2", "Q4"...).
+    Returns (preamble, sections): the text before the first heading and one string
+    per question. An exam without recognizable headings is a single section.
+    """
+    matches = list(QUESTION_HEADING_PATTERN.finditer(exam_text))
+    if not matches:
+        return "", [exam_text]
+    sections = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(exam_text)
+        sections.append(exam_text[match.start():end])
+    return exam_text[:matches[0].start()], sections
+
+
+def group_exam_sections(sections, max_chars=SECTIONED_RUBRIC_SECTION_CHARS):
+    """Pack consecutive sections into groups of at most max_chars (an oversize section stays alone)"""
+    groups, current, size = [], [], 0
+    for section in sections:
+        if current and size + len(section) > max_chars:
+            groups.append(current)
+            current, size = [], 0
+        current.append(section)
+        size += len(section)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def stated_points(text):
+    """Points announced in a text: the barème total ("Noté sur 20") or a heading's "(4 points)" """
+    match = STATED_TOTAL_PATTERN.search(text) or POINTS_PATTERN.search(text)
+    return to_number(match.group(1)) if match else None
+
+
+def rubric_items(rubric):
+    """The list of question items of a rubric, whatever key the model stored them under"""
+    if isinstance(rubric, list):
+        return [item for item in rubric if isinstance(item, dict)]
+    if isinstance(rubric, dict):
+        for value in rubric.values():
+            if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+                return value
+        for value in rubric.values():
+            if isinstance(value, dict):
+                items = rubric_items(value)
+                if items:
+                    return items
+    return []
+
+
+def _find_item_key(item, words):
+    """First key matching one of `words` (by priority); short words must be whole tokens"""
+    for word in words:
+        for key in item:
+            lowered = key.lower()
+            if word in re.split(r'[^a-zà-ÿ]+', lowered) or (len(word) > 3 and word in lowered):
+                return key
+    return None
+
+
+@lru_cache(maxsize=4096)
+def item_field_keys(keys):
+    """(id key, score key, max points key) of an item schema, resolved once per key set"""
+    item = dict.fromkeys(keys)
+    id_key = _find_item_key(item, ('question_id', 'id', 'number', 'numero', 'num'))
+    max_key = _find_item_key(item, ('max', 'points', 'marks', 'bareme', 'barème', 'pts'))
+    score_key = next((key for word in ('student_score', 'score', 'earned', 'awarded', 'obtained', 'note')
+                      for key in keys if word in key.lower() and 'max' not in key.lower()), None)
+    return id_key, score_key, max_key
+
+
+def item_question_id(item):
+    """(key, value) of an item's question ID, or (None, None)"""
+    key = item_field_keys(tuple(item))[0]
+    return (key, item[key]) if key else (None, None)
+
+
+def item_max_points(item):
+    """An item's maximum points as a float, or None when it has none"""
+    key = item_field_keys(tuple(item))[2]
+    return to_number(item[key]) if key else None
+
+
+def item_score(item):
+    """A graded item's awarded score as a float, or None (never the max points)"""
+    key = item_field_keys(tuple(item))[1]
+    return to_number(item[key]) if key else None
+
+
+def merge_rubric_sections(parts, section_points=None, stated_total=None):
+    """
+    Merge the rubrics extracted from consecutive exam sections into one rubric.
+    Items keep the paper's order; duplicated question IDs (a model renumbering
+    its excerpt from 1) are made unique. `section_points` holds the points
+    announced in each part's headings and `stated_total` the exam's barème;
+    mismatches with the extracted max points are listed under "warnings".
+    """
+    items, seen_ids, warnings = [], set(), []
+    for part_index, part in enumerate(parts):
+        part_total = 0.0
+        for item in rubric_items(part):
+            item = dict(item)
+            key, question_id = item_question_id(item)
+            if key is None:
+                key, question_id = 'question_id', f"Q{len(items) + 1}"
+                item[key] = question_id
+            if str(question_id) in seen_ids:
+                new_id = f"{question_id}-{part_index + 1}"
+                warnings.append(f"Identifiant {question_id} en double, renommé {new_id}")
+                item[key] = question_id = new_id
+            seen_ids.add(str(question_id))
+            part_total += item_max_points(item) or 0.0
+            items.append(item)
+
+        expected = section_points[part_index] if section_points else None
+        if expected is not None and abs(expected - part_total) > 0.01:
+            warnings.append(f"Section {part_index + 1} : {part_total:g} points extraits pour {expected:g} annoncés")
+
+    total = sum(item_max_points(item) or 0.0 for item in items)
+    if stated_total is not None and abs(stated_total - total) > 0.01:
+        warnings.append(f"Total extrait {total:g} différent du barème annoncé ({stated_total:g})")
+
+    return {
+        "rubric": items,
+        "total_points": total,
+        "stated_total_points": stated_total,
+        "points_consistent": not warnings,
+        "warnings": warnings,
+    }
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def _normalize_question_id(question_id):
+    """'Question 3', 'Q3' and 3 all name the same question"""
+    text = normalize_text(question_id).lower()
+    return QUESTION_ID_PREFIX_PATTERN.sub('', text) or text
+
+
+def _items_by_id(items):
+    """{normalized question id: item}, falling back to the position for items without an ID"""
+    indexed = OrderedDict()
+    for position, item in enumerate(items):
+        question_id = item_question_id(item)[1]
+        indexed[_normalize_question_id(question_id) if question_id is not None else f"#{position}"] = item
+    return indexed
+
+
+def diff_rubrics(old_rubric, new_rubric):
+    """
+    Compare two rubrics item by item (matched on question ID).
+    Returns {"changed", "added", "removed", "unchanged"}, lists of question IDs;
+    an item is changed when anything in it differs (points, keywords, topic...).
+    """
+    old_items = _items_by_id(rubric_items(old_rubric))
+    new_items = _items_by_id(rubric_items(new_rubric))
+    diff = {"changed": [], "added": [], "removed": [], "unchanged": []}
+    for question_id, item in new_items.items():
+        if question_id not in old_items:
+            diff["added"].append(question_id)
+        elif _canonical(item) != _canonical(old_items[question_id]):
+            diff["changed"].append(question_id)
+        else:
+            diff["unchanged"].append(question_id)
+    diff["removed"] = [question_id for question_id in old_items if question_id not in new_items]
+    return diff
+
+
+def merge_gradings(previous_grading, regraded_items, new_rubric):
+    """
+    Build the grading for `new_rubric` from a previous grading: items in
+    `regraded_items` ({question id: graded item}) replace the previous ones,
+    the others are reused as is, removed items are dropped and totals are
+    recomputed. Returns None if an item of the new rubric has no grading at all.
+    """
+    previous_items = rubric_items(previous_grading)
+    previous_by_id = _items_by_id(previous_items)
+    corrections = []
+    for question_id in _items_by_id(rubric_items(new_rubric)):
+        item = regraded_items.get(question_id, previous_by_id.get(question_id))
+        if item is None:
+            return None
+        corrections.append(item)
+
+    merged = dict(previous_grading) if isinstance(previous_grading, dict) else {}
+    items_key = next((key for key, value in merged.items() if value is previous_items), 'corrections')
+    merged[items_key] = corrections
+    merged['total_score'] = sum(item_score(item) or 0.0 for item in corrections)
+    merged['max_total'] = sum(item_max_points(item) or 0.0 for item in corrections)
+    return merged
+
+
+def _compact_value(value):
+    """Whitespace-collapsed strings, 4.0 as 4; keys with an empty value dropped, every other field kept"""
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, list):
+        return [_compact_value(v) for v in value]
+    if isinstance(value, dict):
+        compact = {}
+        for key, v in value.items():
+            v = _compact_value(v)
+            if v not in ("", None, [], {}):
+                compact[key] = v
+        return compact
+    return value
+
+
+def _rubric_shape(items):
+    """Item IDs and, per item, the length of each non-empty list field (expected elements, criteria...)"""
+    return [
+        (question_id, sorted((key, len(value)) for key, value in item.items() if isinstance(value, list) and value))
+        for question_id, item in _items_by_id(items).items()
+    ]
+
+
+def compact_rubric(rubric_json):
+    """
+    Compact form of a rubric for prompts: the list of its items with every
+    field kept under its original name (French keys included), whitespace
+    collapsed and empty values dropped. Only the wrapper and its totals go,
+    the model recomputes them. If the items do not survive intact (same IDs,
+    same number of elements per list), the items are kept as they were.
+    """
+    items = rubric_items(rubric_json)
+    if not items:
+        return rubric_json
+    compact = [_compact_value(item) for item in items]
+    if _rubric_shape(compact) != _rubric_shape(items):
+        return items
+    return compact
+
+
+def compact_json(value):
+    """JSON without whitespace between tokens nor \\u escapes (é is 1 character, not 6)"""
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+class MemoryCache:
+    """Thread-safe in-memory LRU cache with optional TTL (in seconds)"""
+
+    def __init__(self, max_entries=256, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def compiled_per_rubric(cache, rubric_json, build):
+    """
+    build(rubric_json), memoized in `cache` (a MemoryCache) by rubric content:
+    the objects built once per rubric and reused for every copy of the class
+    """
+    key = hashlib.sha256(_canonical(rubric_json).encode('utf-8')).hexdigest()
+    compiled = cache.get(key)
+    if compiled is None:
+        # Built outside the cache lock: a concurrent first use may compile twice, harmlessly
+        compiled = build(rubric_json)
+        cache.set(key, compiled)
+    return compiled
+
+
+class DiskCache:
+    """Persistent JSON-file cache (one file per key) with size and TTL eviction"""
+
+    def __init__(self, directory, max_entries=10000, ttl=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        """Store a value; a failed write only costs the cache entry, never the caller's result"""
+        path = self._path(key)
+        # Unique across threads and processes (API server and workers share the directory)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with self._lock:
+            try:
+                # Write then rename so readers never see a half-written file
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(value, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Could not write cache entry {key}: {e}")
+                self._remove(tmp_path)
+                return
+            self._evict()
+
+    def _evict(self):
+        """Drop expired entries, then the oldest ones above max_entries"""
+        try:
+            files = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith('.json')]
+        except OSError:
+            return
+        if len(files) <= self.max_entries and self.ttl is None:
+            return
+
+        now = time.time()
+        dated = []
+        for path in files:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if self.ttl is not None and now - mtime > self.ttl:
+                self._remove(path)
+            else:
+                dated.append((mtime, path))
+
+        dated.sort()
+        for _, path in dated[:max(0, len(dated) - self.max_entries)]:
+            self._remove(path)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                self._remove(os.path.join(self.directory, name))
+
+
+class SqliteCache:
+    """Persistent single-file SQLite cache with size and TTL eviction"""
+
+    def __init__(self, path, max_entries=100000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_stored_at ON cache (stored_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Store a value; a failed write only costs the cache entry, never the caller's result"""
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)", (key, payload, time.time())
+                )
+                self._writes += 1
+                # Evicting on every write would cost a count(*) each time
+                if self._writes % 100 == 0:
+                    self._evict()
+                self._conn.commit()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Could not write cache entry {key}: {e}")
+                self._conn.rollback()
+
+    def _evict(self):
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM cache WHERE stored_at < ?", (time.time() - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY stored_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+
+class TieredCache:
+    """Memory LRU in front of an optional persistent tier, with hit/miss counters"""
+
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory if memory is not None else MemoryCache()
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self.stats[name] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('hits', 'memory_hits')
+            return value
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                # Promote to memory so the next lookup skips the disk
+                self.memory.set(key, value)
+                self._count('hits', 'disk_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['memory_entries'] = len(self.memory)
+        return stats
+
+
+def create_rubric_cache(directory=RUBRIC_CACHE_DIR, max_entries=256, max_disk_entries=10000, ttl=None):
+    """Default rubric cache: memory LRU + JSON files that survive restarts"""
+    return TieredCache(
+        memory=MemoryCache(max_entries=max_entries, ttl=ttl),
+        disk=DiskCache(directory, max_entries=max_disk_entries, ttl=ttl)
+    )
+
+
+def create_grading_cache(path=GRADING_CACHE_PATH, max_entries=1024, max_disk_entries=100000, ttl=None):
+    """Default grading cache: memory LRU + SQLite file that survives restarts"""
+    return TieredCache(
+        memory=MemoryCache(max_entries=max_entries, ttl=ttl),
+        disk=SqliteCache(path, max_entries=max_disk_entries, ttl=ttl)
+    )
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the model while the circuit breaker is open"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ModelResponseError(ValueError):
+    """The model answered, but not with usable JSON (even after repair)"""
+
+
+def parse_model_json(text):
+    """
+    Parse a model answer as JSON, repairing the usual defects:
+    markdown code fences, prose around the payload and trailing commas.
+    """
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        pass
+
+    candidate = str(text or '').strip()
+    fenced = re.search(r'```(?:json)?\s*(.*?)```', candidate, re.DOTALL)
+    if fenced:
+        candidate = fenced.group(1).strip()
+
+    # Keep the outermost object/array if the model wrapped it in prose
+    starts = [i for i in (candidate.find('{'), candidate.find('[')) if i != -1]
+    if starts:
+        start = min(starts)
+        end = candidate.rfind('}' if candidate[start] == '{' else ']')
+        if end > start:
+            candidate = candidate[start:end + 1]
+
+    candidate = re.sub(r',\s*([}\]])', r'\1', candidate)
+    try:
+        return json.loads(candidate)
+    except ValueError as e:
+        raise ModelResponseError(f"Model returned invalid JSON: {e}") from e
+
+
+class IncrementalJSONItems:
+    """
+    Incremental scanner for a streamed JSON document.
+    feed() returns every object completed so far inside the "item array": the
+    first array found to contain objects (e.g. the 'corrections' list of a
+    grading). This lets callers act on each graded item before the document ends.
+    """
+
     def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.text = ''
+        self._pos = 0
+        self._stack = []          # ('{' | '[', array_id)
+        self._in_string = False
+        self._escape = False
+        self._next_array_id = 0
+        self._item_array = None
+        self._item_start = None
+
+    def feed(self, chunk):
+        self.text += chunk
+        items = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char == '[':
+                self._stack.append(('[', self._next_array_id))
+                self._next_array_id += 1
+            elif char == '{':
+                parent = self._stack[-1] if self._stack else None
+                if parent and parent[0] == '[' and self._item_array in (None, parent[1]) and self._item_start is None:
+                    self._item_array = parent[1]
+                    self._item_start = i
+                self._stack.append(('{', None))
+            elif char in '}]':
+                if self._stack:
+                    self._stack.pop()
+                if char == '}' and self._item_start is not None and self._stack \
+                        and self._stack[-1] == ('[', self._item_array):
+                    try:
+                        items.append(json.loads(text[self._item_start:i + 1]))
+                    except ValueError:
+                        pass
+                    self._item_start = None
+        self._pos = len(text)
+        return items
+
+
+def is_retryable_error(error):
+    """Quota (429), server (5xx) and timeout errors are worth retrying; the rest are not"""
+    if isinstance(error, ModelResponseError):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+    if isinstance(status, int):
+        return status == 429 or status == 408 or status >= 500
+    # google.api_core exceptions without importing google.api_core here
+    return type(error).__name__ in (
+        'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+        'DeadlineExceeded', 'GatewayTimeout', 'Timeout', 'ConnectionError'
+    )
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` calls per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available; returns the time spent waiting"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds; then lets a single trial call through (half-open).
+    A trial that never reports back is given up after `reset_timeout` seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError("Model temporarily unavailable (circuit open)", retry_after=remaining)
+                self.state = self.HALF_OPEN
+                self._trial_started_at = time.monotonic()
+                return
+            if self.state == self.HALF_OPEN:
+                elapsed = time.monotonic() - self._trial_started_at
+                if elapsed >= self.reset_timeout:
+                    # The previous trial was lost (its caller never reported): this call is the new trial
+                    self._trial_started_at = time.monotonic()
+                    return
+                # A trial call is already in flight
+                raise CircuitOpenError("Model temporarily unavailable (circuit half-open)",
+                                       retry_after=self.reset_timeout - elapsed)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def release_trial(self):
+        """The call ended without an outcome (e.g. abandoned stream): let the next call be the trial"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic() - self.reset_timeout
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class QuotaLimiter:
+    """Token bucket + concurrency semaphore + circuit breaker for one model quota"""
+
+    def __init__(self, requests_per_minute=MODEL_REQUESTS_PER_MINUTE, max_concurrency=MODEL_MAX_CONCURRENCY,
+                 breaker=None):
+        self.rate_limiter = TokenBucket(requests_per_minute / 60.0) if requests_per_minute else None
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+
+
+# One limiter per model name, shared by every client in the process (the quota is global)
+_quota_limiters = {}
+_quota_limiters_lock = threading.Lock()
 
-    def extract_rubric(self, exam_text):
+
+def get_quota_limiter(model_name):
+    with _quota_limiters_lock:
+        limiter = _quota_limiters.get(model_name)
+        if limiter is None:
+            limiter = _quota_limiters[model_name] = QuotaLimiter()
+        return limiter
+
+
+class ModelClient:
+    """
+    Rate-limit-aware access to a model backend.
+    Every call goes through the circuit breaker, a token bucket sized to the
+    quota and a global concurrency semaphore (shared per model name unless a
+    limiter is given); retryable failures (429/5xx, timeouts, malformed JSON)
+    are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, backend, limiter=None, max_retries=MODEL_MAX_RETRIES, base_delay=0.5, max_delay=20.0):
+        self.backend = backend
+        self.limiter = limiter if limiter is not None else get_quota_limiter(backend.model_name)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'retries': 0, 'errors': 0, 'json_repairs': 0, 'rejected': 0,
+                      'rate_limited_seconds': 0.0, 'prompt_tokens': 0, 'response_tokens': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _account(self, task, prompt, response_chars, usage, started, status="ok"):
+        """
+        Per-call token accounting into stats and metrics: the counts the backend
+        reported in `usage`, estimated with estimate_tokens when it reported none.
+        """
+        prompt_tokens = usage.get('prompt_tokens', estimate_tokens(prompt))
+        response_tokens = usage.get('response_tokens', (response_chars + 3) // 4)
+        with self._lock:
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['response_tokens'] += response_tokens
+        metrics.model_call(task, prompt_tokens, response_tokens, time.perf_counter() - started, status)
+
+    def backoff_delay(self, attempt, error=None):
+        """Full-jitter exponential backoff, honouring a server-provided retry delay if any"""
+        retry_after = getattr(error, 'retry_after', None)
+        if isinstance(retry_after, (int, float)) and retry_after > 0:
+            return min(self.max_delay, retry_after)
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def generate_json(self, prompt, task=None, context=None):
+        attempt = 0
+        while True:
+            breaker = self.limiter.breaker
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                self._count('rejected')
+                raise
+
+            if self.limiter.rate_limiter is not None:
+                waited = self.limiter.rate_limiter.acquire()
+                if waited:
+                    self._count('rate_limited_seconds', waited)
+
+            text = None
+            usage = {}
+            try:
+                with self.limiter.semaphore:
+                    self._count('calls')
+                    metrics.count('autocorrect_model_calls_total', task=task)
+                    started = time.perf_counter()
+                    try:
+                        with metrics.span('model_call'):
+                            text = self.backend.generate(prompt, task=task, context=context, usage=usage)
+                    finally:
+                        self._account(task, prompt, len(text or ''), usage, started,
+                                      "ok" if text is not None else "error")
+                with metrics.span('json_parse'):
+                    try:
+                        result = json.loads(text)
+                    except (TypeError, ValueError):
+                        result = parse_model_json(text)
+                        self._count('json_repairs')
+            except Exception as e:
+                self._count('errors')
+                metrics.count('autocorrect_model_errors_total', task=task)
+                if not is_retryable_error(e):
+                    # The model answered; our request was at fault, not the service
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                self._count('retries')
+                metrics.count('autocorrect_model_retries_total', task=task)
+                time.sleep(self.backoff_delay(attempt, e))
+                attempt += 1
+                continue
+
+            breaker.record_success()
+            return result
+
+    def generate_stream(self, prompt, task=None, context=None):
+        """
+        Stream raw response chunks through the same limiter and breaker.
+        Failures before the first chunk are retried like generate_json; once
+        output has been yielded the error is raised to the consumer.
+        """
+        attempt = 0
+        while True:
+            breaker = self.limiter.breaker
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                self._count('rejected')
+                raise
+
+            if self.limiter.rate_limiter is not None:
+                waited = self.limiter.rate_limiter.acquire()
+                if waited:
+                    self._count('rate_limited_seconds', waited)
+
+            started = False
+            received = 0
+            usage = {}
+            call_started = time.perf_counter()
+            try:
+                with self.limiter.semaphore:
+                    self._count('calls')
+                    metrics.count('autocorrect_model_calls_total', task=task)
+                    call_started = time.perf_counter()
+                    with metrics.span('model_call'):
+                        for chunk in self.backend.generate_stream(prompt, task=task, context=context, usage=usage):
+                            started = True
+                            received += len(chunk)
+                            yield chunk
+            except GeneratorExit:
+                # The consumer went away (e.g. SSE client disconnected): resolve the breaker anyway
+                self._account(task, prompt, received, usage, call_started, "abandoned")
+                if started:
+                    breaker.record_success()
+                else:
+                    breaker.release_trial()
+                raise
+            except Exception as e:
+                self._account(task, prompt, received, usage, call_started, "error")
+                self._count('errors')
+                metrics.count('autocorrect_model_errors_total', task=task)
+                if not is_retryable_error(e):
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if started or attempt >= self.max_retries:
+                    raise
+                self._count('retries')
+                metrics.count('autocorrect_model_retries_total', task=task)
+                time.sleep(self.backoff_delay(attempt, e))
+                attempt += 1
+                continue
+
+            breaker.record_success()
+            self._account(task, prompt, received, usage, call_started)
+            return
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['circuit_state'] = self.limiter.breaker.state
+        return stats
+
+
+GRADING_INSTRUCTIONS = """Act as a strict but fair academic grader.
+
+INSTRUCTIONS:
+- Go through the rubric item by item.
+- Compare the student's answer to the "expected elements".
+- Assign a score for each item (do not exceed max points).
+- Provide a justification for the score (mention missing keywords or logic errors).
+- Calculate the final total score.
+Output valid JSON.
+"""
+
+
+class GradingPromptBuilder:
+    """
+    Grading prompt precompiled for one rubric. The rubric is encoded once
+    (compact_rubric) and everything before the student copy is rendered once
+    into `prefix`, so building a copy's prompt is a single concatenation.
+    The prefix is identical for the whole class, which also lets providers
+    with prompt-prefix caching reuse it.
+    """
+
+    def __init__(self, rubric_json):
+        self.rubric_text = compact_json(compact_rubric(rubric_json))
+        self.prefix = f"{GRADING_INSTRUCTIONS}\nRUBRIC (JSON): {self.rubric_text}\n\nSTUDENT COPY:\n"
+        self.prefix_tokens = estimate_tokens(self.prefix)
+
+    def build(self, student_copy, hints=None):
+        if not hints:
+            return f"{self.prefix}{student_copy}\n"
+        return (
+            f"{self.prefix}{student_copy}\n\n"
+            "LOCAL KEYWORD COVERAGE (automatic exact matching, hints only; verify every item yourself, "
+            "paraphrases and synonyms count, a matched keyword alone does not earn the points):\n"
+            f"{hints}\n"
+        )
+
+
+_prompt_builders = MemoryCache(max_entries=PROMPT_BUILDER_CACHE_SIZE)
+
+
+def get_prompt_builder(rubric_json):
+    """GradingPromptBuilder for a rubric, compiled once and reused for every copy of the class"""
+    return compiled_per_rubric(_prompt_builders, rubric_json, GradingPromptBuilder)
+
+
+class AutoCorrectAI:
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, rubric_cache=None, max_concurrency=GRADING_CONCURRENCY,
+                 backend=None, grading_cache=None, client=None, prescoring=PRESCORING):
+        """
+        `backend` is a model_backends.ModelBackend (or a name such as 'fake');
+        by default the MODEL_BACKEND environment variable picks it (Gemini).
+        With `prescoring`, copies are first matched locally against the rubric's
+        expected elements (see prescore()).
+        """
+        if backend is None or isinstance(backend, str):
+            kwargs = {} if model_name == DEFAULT_MODEL_NAME else {"model_name": model_name}
+            backend = create_backend(backend, **kwargs)
+        self.backend = backend
+        self.client = client if client is not None else ModelClient(backend)
+        self.model_name = backend.model_name
+        self.max_concurrency = max_concurrency
+        self.rubric_cache = rubric_cache if rubric_cache is not None else create_rubric_cache()
+        self.grading_cache = grading_cache if grading_cache is not None else create_grading_cache()
+        self.prescoring = prescoring
+
+    def _generate_json(self, prompt, task=None, context=None):
+        """Send a prompt through the shared model client and parse its JSON answer"""
+        return self.client.generate_json(prompt, task=task, context=context)
+
+    def extract_rubric(self, exam_text, use_cache=True, cache_info=None, sectioned=None):
         """
         Step 1: Extract the grading criteria (Barème) from the exam paper.
+        Identical exams (after whitespace normalization) are served from the rubric cache.
+        If `cache_info` is a dict, cache_info['rubric'] is set to 'hit', 'miss' or 'bypass'.
+        Long exams (or sectioned=True) are extracted section by section, see extract_rubric_sectioned.
         """
-        prompt = f"""
+        with metrics.span('rubric_extraction'):
+            cache_key = rubric_cache_key(exam_text, self.model_name)
+            if use_cache:
+                cached = self.rubric_cache.get(cache_key)
+                if cached is not None:
+                    metrics.count('autocorrect_cache_lookups_total', cache='rubric', result='hit')
+                    if cache_info is not None:
+                        cache_info['rubric'] = 'hit'
+                    return cached
+            metrics.count('autocorrect_cache_lookups_total', cache='rubric', result='miss' if use_cache else 'bypass')
+            if cache_info is not None:
+                cache_info['rubric'] = 'miss' if use_cache else 'bypass'
+
+            if sectioned is None:
+                sectioned = len(exam_text) >= SECTIONED_RUBRIC_MIN_CHARS
+            if sectioned:
+                rubric = self.extract_rubric_sectioned(exam_text, use_cache=use_cache)
+            else:
+                rubric = self._generate_json(self._rubric_prompt(exam_text), task='rubric',
+                                             context={"exam_text": exam_text})
+            self.rubric_cache.set(cache_key, rubric)
+            return rubric
+
+    @staticmethod
+    def _rubric_prompt(exam_text):
+        return f"""
         Act as an expert pedagogical engineer. Analyze the following Exam Paper.
         Extract the grading rubric into a structured JSON format.
         For each question or section, identify:
@@ -34,39 +1096,454 @@ class AutoCorrectAI:
         {exam_text}
         """
 
-        # Enforce JSON output schema
-        result = self.model.generate_content(
-            prompt,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        return json.loads(result.text)
+    def _extract_section_rubric(self, preamble, section_text, use_cache=True):
+        """Rubric of one exam excerpt; cached on its own so editing one question only re-extracts its section"""
+        cache_key = rubric_cache_key(f"[section]\n{preamble}\n{section_text}", self.model_name)
+        if use_cache:
+            cached = self.rubric_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        prompt = f"""
+        Act as an expert pedagogical engineer. Analyze the following EXCERPT of an Exam Paper
+        (only some of its questions; the others are handled separately).
+        Extract the grading rubric of this excerpt into a structured JSON format.
+        For each question, identify:
+        - The question ID/Number, exactly as numbered in the paper.
+        - The topic.
+        - The maximum points assigned.
+        - The key elements expected in the answer (keywords, concepts).
 
-    def grade_student(self, rubric_json, student_copy):
+        EXAM HEADER (context only, extract no question from it):
+        {preamble}
+
+        EXAM EXCERPT:
+        {section_text}
+        """
+        rubric = self._generate_json(prompt, task='rubric', context={"exam_text": section_text})
+        self.rubric_cache.set(cache_key, rubric)
+        return rubric
+
+    def extract_rubric_sectioned(self, exam_text, use_cache=True, max_section_chars=SECTIONED_RUBRIC_SECTION_CHARS):
+        """
+        Extract the rubric of a long exam in parallel: the paper is split on its
+        question headings, consecutive questions are packed up to max_section_chars,
+        every group is extracted concurrently (with the exam header as context) and
+        the parts are merged by merge_rubric_sections, which also checks the points
+        against the barème stated in the paper. Latency is that of the largest group.
+        """
+        preamble, sections = split_exam_sections(exam_text)
+        groups = group_exam_sections(sections, max_section_chars)
+        if len(groups) < 2:
+            # Nothing to parallelize: a single call on the whole paper
+            return self._generate_json(self._rubric_prompt(exam_text), task='rubric',
+                                       context={"exam_text": exam_text})
+        header = preamble.strip()[:SECTION_PREAMBLE_CHARS]
+
+        def run(group):
+            return self._extract_section_rubric(header, "".join(group), use_cache)
+
+        workers = max(1, min(self.max_concurrency, len(groups)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(metrics.in_context(run), groups))
+
+        # Per-group points announced in the headings, only when every heading announces them
+        section_points = []
+        for group in groups:
+            points = [stated_points(section.strip().splitlines()[0]) if section.strip() else None
+                      for section in group]
+            section_points.append(sum(points) if None not in points else None)
+        stated_total = stated_points(preamble) if preamble else None
+        return merge_rubric_sections(parts, section_points, stated_total)
+
+    def prescore(self, rubric_json, student_copy):
+        """
+        Local keyword coverage of a copy (no model call): per-item found/missing
+        expected elements, a provisional score and whether the copy is blank.
+        """
+        # Imported here: prescoring builds on the rubric helpers of this module
+        from prescoring import get_prescorer
+
+        with metrics.span('prescoring'):
+            return get_prescorer(rubric_json).score(student_copy)
+
+    def _prescore_for_grading(self, rubric_json, student_copy):
+        """(blank grading or None, prompt hints) for a copy about to be sent to the model"""
+        if not self.prescoring:
+            return None, None
+        from prescoring import blank_grading, prompt_hints
+
+        prescore = self.prescore(rubric_json, student_copy)
+        if prescore["empty"]:
+            metrics.count('autocorrect_prescore_skipped_total')
+            return blank_grading(rubric_json, prescore), None
+        return None, prompt_hints(prescore)
+
+    @staticmethod
+    def _grading_prompt(rubric_json, student_copy, hints=None):
+        return get_prompt_builder(rubric_json).build(student_copy, hints)
+
+    def grade_student(self, rubric_json, student_copy, use_cache=True, cache_info=None):
         """
         Step 2: Grade the student copy based ONLY on the extracted rubric.
+        Byte-identical (after normalization) rubric/copy pairs are served from the
+        grading cache; use_cache=False forces a regrade and refreshes the cache.
+        If `cache_info` is a dict, cache_info['grading'] is set to 'hit', 'miss' or 'bypass'.
+        """
+        with metrics.span('grading'):
+            cache_key = grading_cache_key(rubric_json, student_copy, self.model_name)
+            if use_cache:
+                cached = self.grading_cache.get(cache_key)
+                if cached is not None:
+                    metrics.count('autocorrect_cache_lookups_total', cache='grading', result='hit')
+                    if cache_info is not None:
+                        cache_info['grading'] = 'hit'
+                    return cached
+            metrics.count('autocorrect_cache_lookups_total', cache='grading', result='miss' if use_cache else 'bypass')
+            if cache_info is not None:
+                cache_info['grading'] = 'miss' if use_cache else 'bypass'
+
+            blank, hints = self._prescore_for_grading(rubric_json, student_copy)
+            if blank is not None:
+                self.grading_cache.set(cache_key, blank)
+                return blank
+
+            prompt = self._grading_prompt(rubric_json, student_copy, hints)
+
+            grading = self._generate_json(
+                prompt, task='grading', context={"rubric": rubric_json, "student_copy": student_copy}
+            )
+            self.grading_cache.set(cache_key, grading)
+            return grading
+
+    def grade_student_stream(self, rubric_json, student_copy, use_cache=True, cache_info=None):
+        """
+        Streaming variant of grade_student. Yields ('item', graded_item) for each
+        rubric item as soon as the model has finished writing it, then
+        ('result', full_grading). Cached gradings are replayed the same way.
+        """
+        cache_key = grading_cache_key(rubric_json, student_copy, self.model_name)
+        cached = self.grading_cache.get(cache_key) if use_cache else None
+        result = 'hit' if cached is not None else ('miss' if use_cache else 'bypass')
+        metrics.count('autocorrect_cache_lookups_total', cache='grading', result=result)
+        if cache_info is not None:
+            cache_info['grading'] = result
+        blank, hints = (None, None) if cached is not None else self._prescore_for_grading(rubric_json, student_copy)
+        if blank is not None:
+            self.grading_cache.set(cache_key, blank)
+            cached = blank
+        if cached is not None:
+            for item in IncrementalJSONItems().feed(json.dumps(cached, ensure_ascii=False)):
+                yield 'item', item
+            yield 'result', cached
+            return
+
+        parser = IncrementalJSONItems()
+        prompt = self._grading_prompt(rubric_json, student_copy, hints)
+        for chunk in self.client.generate_stream(
+            prompt, task='grading', context={"rubric": rubric_json, "student_copy": student_copy}
+        ):
+            for item in parser.feed(chunk):
+                yield 'item', item
+
+        with metrics.span('json_parse'):
+            grading = parse_model_json(parser.text)
+        self.grading_cache.set(cache_key, grading)
+        yield 'result', grading
+
+    def _grade_one(self, rubric_json, index, student_copy, use_cache=True):
+        """
+        grade_student wrapped into a per-copy outcome. Only CircuitOpenError is
+        raised: the model is unavailable for every copy, so the caller answers 503.
         """
+        cache_info = {}
+        try:
+            grading = self.grade_student(rubric_json, student_copy, use_cache=use_cache, cache_info=cache_info)
+            return {"index": index, "status": "success", "grading_result": grading, "cache": cache_info['grading']}
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            return {"index": index, "status": "error", "error": str(e)}
+
+    def plan_grading_batches(self, rubric_json, student_copies, token_budget=GRADING_BATCH_TOKEN_BUDGET,
+                             max_output_tokens=GRADING_BATCH_MAX_OUTPUT_TOKENS,
+                             max_batch_size=GRADING_BATCH_MAX_SIZE):
+        """
+        Split copy indexes into batches sized to the token budget.
+        The rubric and instructions are paid once per batch; each copy adds its own
+        input tokens and roughly one rubric's worth of output tokens.
+        """
+        rubric_tokens = estimate_tokens(get_prompt_builder(rubric_json).rubric_text)
+        available_input = max(1, token_budget - rubric_tokens - estimate_tokens(self._batch_instructions()))
+        # The answer restates every rubric item, whatever the prompt encoding
+        output_per_copy = max(200, estimate_tokens(json.dumps(rubric_json)))
+
+        batches, current, used = [], [], 0
+        for index, student_copy in enumerate(student_copies):
+            # +16 for the {"student_index": n, "copy": ...} wrapper
+            cost = estimate_tokens(student_copy) + 16
+            full = (
+                len(current) >= max_batch_size
+                or used + cost > available_input
+                or (len(current) + 1) * output_per_copy > max_output_tokens
+            )
+            if current and full:
+                batches.append(current)
+                current, used = [], 0
+            current.append(index)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def _batch_instructions():
+        return """
+        INSTRUCTIONS:
+        - Grade every student copy independently; never let one copy influence another.
+        - Go through the rubric item by item.
+        - Compare the student's answer to the "expected elements".
+        - Assign a score for each item (do not exceed max points).
+        - Provide a justification for the score (mention missing keywords or logic errors).
+        - Calculate the final total score.
+
+        Output valid JSON of the form
+        {"results": [{"student_index": <int>, "grading": <grading JSON for that copy>}, ...]}
+        with exactly one entry per student copy.
+        """
+
+    @staticmethod
+    def _is_complete_grading(grading, rubric_json):
+        """A grading with one graded item per rubric item (same question IDs, same count)"""
+        if not isinstance(grading, (dict, list)) or not grading:
+            return False
+        expected = rubric_items(rubric_json)
+        if not expected:
+            # Rubric shape unknown: nothing to compare against
+            return True
+        graded = rubric_items(grading)
+        # Matched on normalized IDs ('Question 1' and 'Q1' agree), in any order
+        return len(graded) == len(expected) and set(_items_by_id(graded)) == set(_items_by_id(expected))
+
+    def grade_batch(self, rubric_json, student_copies, use_cache=True):
+        """
+        Grade K student copies with a single model call returning a JSON array.
+        The answer is split back per student; copies missing from it (or left
+        incomplete) are re-graded one at a time. Returns per-copy outcomes in
+        input order, like grade_many. Cached copies are not sent to the model.
+        """
+        student_copies = list(student_copies)
+        if not student_copies:
+            return []
+
+        outcomes = {}
+        pending = []
+        for index, student_copy in enumerate(student_copies):
+            cache_key = grading_cache_key(rubric_json, student_copy, self.model_name)
+            cached = self.grading_cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                outcomes[index] = {"index": index, "status": "success", "grading_result": cached, "cache": "hit"}
+                continue
+            # Blank copies are graded locally and never take a seat in the batch prompt
+            blank = self._prescore_for_grading(rubric_json, student_copy)[0]
+            if blank is not None:
+                self.grading_cache.set(cache_key, blank)
+                outcomes[index] = {"index": index, "status": "success", "grading_result": blank,
+                                   "cache": "miss" if use_cache else "bypass"}
+            else:
+                pending.append(index)
+
+        if len(pending) == 1:
+            outcomes[pending[0]] = self._grade_one(rubric_json, pending[0], student_copies[pending[0]], use_cache)
+        if len(pending) <= 1:
+            return [outcomes[index] for index in range(len(student_copies))]
+
+        batch_copies = [student_copies[index] for index in pending]
+
+        copies_json = compact_json(
+            [{"student_index": i, "copy": copy} for i, copy in enumerate(batch_copies)]
+        )
         prompt = f"""
         Act as a strict but fair academic grader. 
 
         INPUT DATA:
-        1. RUBRIC (JSON): {json.dumps(rubric_json)}
+        1. RUBRIC (JSON): {get_prompt_builder(rubric_json).rubric_text}
+        2. STUDENT COPIES (JSON array): {copies_json}
+        {self._batch_instructions()}"""
+
+        gradings = {}
+        try:
+            response = self._generate_json(
+                prompt, task='grading_batch', context={"rubric": rubric_json, "student_copies": batch_copies}
+            )
+            entries = response.get("results", []) if isinstance(response, dict) else response
+            for entry in entries if isinstance(entries, list) else []:
+                if not isinstance(entry, dict):
+                    continue
+                position = entry.get("student_index")
+                grading = entry.get("grading")
+                if isinstance(position, int) and 0 <= position < len(batch_copies) \
+                        and self._is_complete_grading(grading, rubric_json):
+                    gradings[position] = grading
+        except CircuitOpenError:
+            raise
+        except Exception:
+            # A failed or unparseable batch just means every copy falls back to single grading
+            pass
+
+        for position, index in enumerate(pending):
+            if position in gradings:
+                self.grading_cache.set(grading_cache_key(rubric_json, student_copies[index], self.model_name),
+                                       gradings[position])
+                outcomes[index] = {"index": index, "status": "success", "grading_result": gradings[position],
+                                   "cache": "miss" if use_cache else "bypass"}
+            else:
+                outcomes[index] = self._grade_one(rubric_json, index, student_copies[index], use_cache)
+        return [outcomes[index] for index in range(len(student_copies))]
+
+    def grade_many(self, rubric_json, student_copies, max_concurrency=None, batched=False,
+                   token_budget=GRADING_BATCH_TOKEN_BUDGET, use_cache=True):
+        """
+        Grade several student copies against the same rubric concurrently.
+        Results keep the input order; a failing copy is reported in place
+        instead of aborting the whole batch, except CircuitOpenError (the model
+        is unavailable for every copy), which is raised. With batched=True, copies are
+        packed several per prompt (see grade_batch) to save calls and tokens.
+        use_cache=False forces every copy to be regraded.
+        """
+        student_copies = list(student_copies)
+        if not student_copies:
+            return []
+
+        if batched:
+            tasks = self.plan_grading_batches(rubric_json, student_copies, token_budget=token_budget)
+        else:
+            tasks = [[index] for index in range(len(student_copies))]
+
+        def run(indexes):
+            if len(indexes) == 1:
+                return [self._grade_one(rubric_json, indexes[0], student_copies[indexes[0]], use_cache)]
+            outcomes = self.grade_batch(rubric_json, [student_copies[i] for i in indexes], use_cache=use_cache)
+            for outcome in outcomes:
+                outcome["index"] = indexes[outcome["index"]]
+            return outcomes
+
+        workers = max(1, min(max_concurrency or self.max_concurrency, len(tasks)))
+        # The model calls are network-bound, so threads overlap them well
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = [outcome for outcomes in executor.map(metrics.in_context(run), tasks) for outcome in outcomes]
+        return sorted(results, key=lambda outcome: outcome["index"])
+
+    @staticmethod
+    def _regrade_prompt(rubric_items_json, student_copy):
+        return f"""
+        Act as a strict but fair academic grader. 
+        The rubric of this exam was corrected: re-grade the student copy on the
+        rubric items below ONLY (the other items are already graded and unchanged).
+
+        INPUT DATA:
+        1. RUBRIC ITEMS TO GRADE (JSON): {compact_json(compact_rubric(rubric_items_json))}
         2. STUDENT COPY: {student_copy}
 
         INSTRUCTIONS:
-        - Go through the rubric item by item.
+        - Go through these rubric items one by one, keeping their question IDs.
         - Compare the student's answer to the "expected elements".
         - Assign a score for each item (do not exceed max points).
         - Provide a justification for the score (mention missing keywords or logic errors).
-        - Calculate the final total score.
 
-        Output valid JSON.
+        Output valid JSON with one graded entry per rubric item above.
         """
 
-        result = self.model.generate_content(
-            prompt,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        return json.loads(result.text)
+    def regrade_changed(self, old_rubric, new_rubric, student_copy, previous_grading, use_cache=True, diff=None):
+        """
+        Incremental regrade after a rubric fix: only the items changed or added
+        in `new_rubric` are sent to the model (narrowed prompt), the previous
+        scores of unchanged items are reused and the totals are recomputed.
+        Falls back to a full grade_student if the partial answer is incomplete.
+        Returns (grading, number of items sent to the model).
+        """
+        diff = diff if diff is not None else diff_rubrics(old_rubric, new_rubric)
+        to_grade = diff["changed"] + diff["added"]
+        new_by_id = _items_by_id(rubric_items(new_rubric))
+
+        regraded = {}
+        if to_grade:
+            narrowed = {"rubric": [new_by_id[question_id] for question_id in to_grade]}
+            # Own prompt version: a partial grading must never be served for a full one
+            cache_key = grading_cache_key(narrowed, student_copy, self.model_name,
+                                          prompt_version=f"{GRADING_PROMPT_VERSION}-partial")
+            partial = self.grading_cache.get(cache_key) if use_cache else None
+            if partial is None:
+                with metrics.span('grading'):
+                    partial = self._generate_json(
+                        self._regrade_prompt(narrowed["rubric"], student_copy), task='grading',
+                        context={"rubric": narrowed, "student_copy": student_copy}
+                    )
+                self.grading_cache.set(cache_key, partial)
+            regraded = {question_id: item for question_id, item in _items_by_id(rubric_items(partial)).items()
+                        if question_id in to_grade}
+
+        merged = merge_gradings(previous_grading, regraded, new_rubric) \
+            if len(regraded) == len(to_grade) else None
+        if merged is None:
+            return self.grade_student(new_rubric, student_copy, use_cache=use_cache), len(new_by_id)
+        return merged, len(to_grade)
+
+    def regrade_many(self, old_rubric, new_rubric, student_copies, previous_gradings, max_concurrency=None,
+                     use_cache=True):
+        """
+        regrade_changed over a class, concurrently. Outcomes follow grade_many
+        (input order, failures in place) plus "regraded_items" per copy.
+        """
+        diff = diff_rubrics(old_rubric, new_rubric)
+        student_copies = list(student_copies)
+        previous_gradings = list(previous_gradings)
+
+        def run(index):
+            try:
+                grading, regraded_items = self.regrade_changed(
+                    old_rubric, new_rubric, student_copies[index], previous_gradings[index],
+                    use_cache=use_cache, diff=diff
+                )
+                return {"index": index, "status": "success", "grading_result": grading,
+                        "regraded_items": regraded_items}
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                return {"index": index, "status": "error", "error": str(e)}
+
+        if not student_copies:
+            return []
+        workers = max(1, min(max_concurrency or self.max_concurrency, len(student_copies)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(metrics.in_context(run), range(len(student_copies))))
+
+    def grade_stream(self, rubric_json, student_copies, max_concurrency=None, use_cache=True, max_pending=None):
+        """
+        Grade copies pulled lazily from an iterable, yielding each outcome (as in
+        grade_many) as soon as it is ready, in completion order. At most
+        `max_pending` copies are held at once, so the producer (e.g. a PDF being
+        parsed) keeps running while earlier copies are graded, in bounded memory.
+        """
+        workers = max(1, max_concurrency or self.max_concurrency)
+        max_pending = max_pending or workers * 2
+        pending = set()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for index, student_copy in enumerate(student_copies):
+                # Context captured per copy: the consumer may resume this generator from another one
+                pending.add(executor.submit(metrics.in_context(self._grade_one), rubric_json, index, student_copy,
+                                            use_cache))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                else:
+                    for future in [f for f in pending if f.done()]:
+                        pending.discard(future)
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+
 
 if __name__ == "__main__":
     ai_engine = AutoCorrectAI()
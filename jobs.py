@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "1000"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobManager:
+    """
+    Background job runner for long corrections.
+    submit() returns a job id immediately; a worker pool runs the job and
+    the caller polls get() for status and result.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, retention_seconds=JOB_RETENTION_SECONDS,
+                 max_finished_jobs=MAX_FINISHED_JOBS):
+        self.retention_seconds = retention_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": QUEUED,
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+        self._executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, func, args, kwargs):
+        self._update(job_id, status=RUNNING, started_at=time.time())
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        else:
+            self._update(job_id, status=DONE, result=result, finished_at=time.time())
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if unknown/expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _prune(self):
+        """Forget finished jobs past retention, and the oldest ones above the cap"""
+        now = time.time()
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in (DONE, FAILED)]
+        overflow = len(finished) - self.max_finished_jobs
+        for job_id in finished:
+            job = self._jobs[job_id]
+            if overflow > 0 or now - job["finished_at"] > self.retention_seconds:
+                del self._jobs[job_id]
+                overflow -= 1
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,219 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; wide enough for a cache hit and for a multi-minute model call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Per-request timing breakdown, set by collect_timings() (see span())
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+# Per-request list of model calls, set by collect_model_calls() (see model_call())
+_request_model_calls = contextvars.ContextVar('request_model_calls', default=None)
+# Guards the collectors above, shared by the pool threads of one request (see in_context())
+_collect_lock = threading.Lock()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms keyed by metric name and labels,
+    rendered in the Prometheus text exposition format by render().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def get(self, name, **labels):
+        """Current value of a counter (0 if never incremented)"""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (histogram.buckets, list(histogram.counts), histogram.count, histogram.sum))
+                for key, histogram in self._histograms.items()
+            )
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("autocorrect_stage_seconds", "Time spent in each pipeline stage")
+REGISTRY.describe("autocorrect_model_calls_total", "Model calls sent to the backend, by task")
+REGISTRY.describe("autocorrect_model_tokens_total", "Estimated prompt/response tokens, by task")
+REGISTRY.describe("autocorrect_model_retries_total", "Model calls retried after a retryable failure")
+REGISTRY.describe("autocorrect_model_errors_total", "Failed model calls, by task")
+REGISTRY.describe("autocorrect_cache_lookups_total", "Rubric/grading cache lookups, by result")
+REGISTRY.describe("autocorrect_prescore_skipped_total", "Blank copies graded locally without a model call")
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a pipeline stage into autocorrect_stage_seconds{stage=...} and, inside
+    collect_timings(), into the current request's breakdown.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.observe("autocorrect_stage_seconds", elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            with _collect_lock:
+                timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def count(name, amount=1, **labels):
+    REGISTRY.inc(name, amount, **labels)
+
+
+def model_call(task, prompt_tokens, response_tokens, seconds, status="ok"):
+    """
+    Account one model call: token counters and, inside collect_model_calls(),
+    a {task, prompt_tokens, response_tokens, ms, status} entry for the current request.
+    """
+    REGISTRY.inc("autocorrect_model_tokens_total", prompt_tokens, task=task, kind='prompt')
+    REGISTRY.inc("autocorrect_model_tokens_total", response_tokens, task=task, kind='response')
+    calls = _request_model_calls.get()
+    if calls is not None:
+        with _collect_lock:
+            calls.append({"task": task, "prompt_tokens": prompt_tokens, "response_tokens": response_tokens,
+                          "ms": round(seconds * 1000, 2), "status": status})
+
+
+def token_usage(calls):
+    """Token totals of a collect_model_calls() list, with the per-call detail"""
+    return {
+        "prompt_tokens": sum(call["prompt_tokens"] for call in calls),
+        "response_tokens": sum(call["response_tokens"] for call in calls),
+        "calls": calls,
+    }
+
+
+def in_context(func):
+    """
+    `func` bound to the caller's context, for thread pools (which do not carry it
+    over): spans and model calls it makes reach the caller's collectors. Every
+    call runs in its own copy, so concurrent calls never share one Context.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+@contextmanager
+def collect_model_calls():
+    """
+    Collect the model calls made by the current thread, and by the pool threads
+    it hands work to through in_context(), into a list (retries included)
+    """
+    calls = []
+    token = _request_model_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _request_model_calls.reset(token)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collect the spans run by the current thread (and its in_context() pool work)
+    into a {stage: seconds} dict. Stages run several times (e.g. model calls with
+    retries, or copies graded in parallel) are summed.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def render():
+    return REGISTRY.render()
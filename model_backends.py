@@ -0,0 +1,264 @@
+import os
+import json
+import hashlib
+import random
+import re
+import threading
+import time
+
+DEFAULT_GEMINI_MODEL = 'gemini-2.5-flash'
+
+
+class ModelBackendError(Exception):
+    """Raised by a backend when the model call itself fails (quota, server error...)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ModelBackend:
+    """
+    Interface every model provider implements.
+    generate() receives the full prompt and returns the raw response text
+    (expected to be JSON). `task` names the pipeline step ('rubric', 'grading',
+    'grading_batch') and `context` carries the structured inputs used to build
+    the prompt; real providers can ignore both. Providers that report token
+    counts store them as 'prompt_tokens' / 'response_tokens' in the `usage`
+    dict when one is passed; callers estimate the counts otherwise.
+    """
+    model_name = "unknown"
+
+    def generate(self, prompt, task=None, context=None, usage=None):
+        raise NotImplementedError
+
+    def generate_stream(self, prompt, task=None, context=None, usage=None):
+        """Yield the response text in chunks; providers without streaming yield it whole"""
+        yield self.generate(prompt, task=task, context=context, usage=usage)
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini provider (the original hardwired implementation)"""
+
+    def __init__(self, model_name=DEFAULT_GEMINI_MODEL, api_key=None):
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("API Key not found! Make sure you created a .env file.")
+
+        # Imported here: the SDK is slow to import and only needed for live calls
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    @staticmethod
+    def _record_usage(usage, response):
+        """Copy the token counts Gemini reports (usage_metadata) into `usage`"""
+        metadata = getattr(response, "usage_metadata", None)
+        if usage is None or metadata is None:
+            return
+        if getattr(metadata, "prompt_token_count", None):
+            usage["prompt_tokens"] = metadata.prompt_token_count
+        if getattr(metadata, "candidates_token_count", None) is not None:
+            usage["response_tokens"] = metadata.candidates_token_count
+
+    def generate(self, prompt, task=None, context=None, usage=None):
+        # Enforce JSON output schema
+        result = self.model.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json"}
+        )
+        self._record_usage(usage, result)
+        return result.text
+
+    def generate_stream(self, prompt, task=None, context=None, usage=None):
+        for chunk in self.model.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json"},
+            stream=True
+        ):
+            # Every chunk carries the running totals; the last one has the final counts
+            self._record_usage(usage, chunk)
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackend(ModelBackend):
+    """
+    Deterministic local provider for offline benchmarks and load tests.
+    Returns schema-valid rubric and grading JSON derived from the inputs,
+    with configurable latency, jitter, error-rate and malformed-JSON injection.
+    `prompt_token_latency` adds seconds per 1000 prompt tokens (~4 characters
+    each), modelling the prefill time of real models. `model_name` only labels
+    the backend (cache keys, stored results), like the real model names do.
+    """
+    model_name = "fake-local"
+
+    QUESTION_PATTERN = re.compile(r'(?im)^\s*(?:question|exercice|exercise|q)\s*[\.:#-]?\s*(\d+)')
+    POINTS_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(?:points?|pts?)\b', re.IGNORECASE)
+    WORD_PATTERN = re.compile(r"[^\W\d_]{6,}", re.UNICODE)
+    IGNORED_WORDS = {"question", "questions", "exercice", "exercise", "points"}
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, malformed_rate=0.0,
+                 prompt_token_latency=0.0, model_name=None):
+        if model_name:
+            self.model_name = model_name
+        self.latency = latency
+        self.prompt_token_latency = prompt_token_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _simulate_call(self, latency_fraction=1.0, prompt=""):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter) if self.jitter else self.latency
+            delay *= latency_fraction
+            delay += self.prompt_token_latency * len(prompt) / 4000
+            fail = bool(self.error_rate) and self._random.random() < self.error_rate
+            malformed = bool(self.malformed_rate) and self._random.random() < self.malformed_rate
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise ModelBackendError("Injected fake backend error (429 Resource exhausted)", status_code=429)
+        return malformed
+
+    def generate_stream(self, prompt, task=None, context=None, usage=None, chunk_size=64):
+        """Same payload as generate(), delivered in chunks spread over the latency"""
+        # 20% of the latency before the first chunk, the rest spread over the chunks
+        text = self._respond(prompt, task, context, latency_fraction=0.2)
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or ['']
+        pause = self.latency * 0.8 / len(chunks)
+        for chunk in chunks:
+            if pause > 0:
+                time.sleep(pause)
+            yield chunk
+
+    def generate(self, prompt, task=None, context=None, usage=None):
+        # No token counts reported: the client falls back to estimate_tokens
+        return self._respond(prompt, task, context)
+
+    def _respond(self, prompt, task, context, latency_fraction=1.0):
+        malformed = self._simulate_call(latency_fraction, prompt)
+        context = context or {}
+
+        if task == 'rubric':
+            payload = self.fake_rubric(context.get('exam_text', prompt))
+        elif task == 'grading':
+            payload = self.fake_grading(context.get('rubric'), context.get('student_copy', ''))
+        elif task == 'grading_batch':
+            payload = {"results": [
+                {"student_index": i, "grading": self.fake_grading(context.get('rubric'), student_copy)}
+                for i, student_copy in enumerate(context.get('student_copies', []))
+            ]}
+        else:
+            payload = {"echo": self._digest(prompt)[:12]}
+        text = json.dumps(payload, ensure_ascii=False)
+        if malformed:
+            # What chatty models do: code fences, a preamble and a trailing comma
+            text = "Voici le résultat :\n```json\n" + text[:-1] + ",}\n```"
+        return text
+
+    def _digest(self, text):
+        return hashlib.sha256(f"{self.seed}:{text}".encode('utf-8')).hexdigest()
+
+    def _key_elements(self, text, limit=4):
+        """Longest distinct words of a section, used as fake expected keywords"""
+        seen = []
+        for word in sorted(self.WORD_PATTERN.findall(text), key=lambda w: (-len(w), w.lower())):
+            if word.lower() not in seen and word.lower() not in self.IGNORED_WORDS:
+                seen.append(word.lower())
+            if len(seen) == limit:
+                break
+        return seen
+
+    def fake_rubric(self, exam_text):
+        matches = list(self.QUESTION_PATTERN.finditer(exam_text))
+        if matches:
+            sections = []
+            for i, match in enumerate(matches):
+                end = matches[i + 1].start() if i + 1 < len(matches) else len(exam_text)
+                sections.append((f"Q{match.group(1)}", exam_text[match.start():end]))
+        else:
+            sections = [("Q1", exam_text)]
+
+        items = []
+        for question_id, section in sections:
+            points = self.POINTS_PATTERN.search(section)
+            max_points = float(points.group(1).replace(',', '.')) if points else 5.0
+            first_line = section.strip().splitlines()[0] if section.strip() else question_id
+            items.append({
+                "question_id": question_id,
+                "topic": first_line[:80],
+                "max_points": max_points,
+                "key_elements": self._key_elements(section)
+            })
+
+        return {
+            "rubric": items,
+            "total_points": sum(item["max_points"] for item in items)
+        }
+
+    def fake_grading(self, rubric, student_copy):
+        items = rubric.get("rubric", []) if isinstance(rubric, dict) else (rubric or [])
+        copy_lower = str(student_copy).lower()
+        corrections = []
+
+        for item in items:
+            max_points = float(item.get("max_points", 0) or 0)
+            elements = item.get("key_elements") or []
+            found = [e for e in elements if str(e).lower() in copy_lower]
+            missing = [e for e in elements if e not in found]
+            if elements:
+                ratio = len(found) / len(elements)
+            else:
+                ratio = int(self._digest(f"{item.get('question_id')}:{student_copy}")[:4], 16) / 0xFFFF
+            score = round(max_points * ratio * 2) / 2
+
+            corrections.append({
+                "question_id": item.get("question_id", "Q?"),
+                "topic": item.get("topic", ""),
+                "max_points": max_points,
+                "student_score": score,
+                "student_answer": str(student_copy)[:500],
+                "grading_breakdown": [{
+                    "element": item.get("topic", item.get("question_id", "")),
+                    "max_points": max_points,
+                    "score": score,
+                    "justification": ("Éléments présents : " + ", ".join(found) if found else "Aucun élément attendu trouvé.")
+                                     + (" Manquants : " + ", ".join(missing) if missing else "")
+                }],
+                "overall_feedback": "Correction simulée (backend local)."
+            })
+
+        return {
+            "corrections": corrections,
+            "total_score": sum(c["student_score"] for c in corrections),
+            "max_total": sum(c["max_points"] for c in corrections)
+        }
+
+
+def create_backend(name=None, **kwargs):
+    """
+    Build a backend by name ('gemini' or 'fake'), defaulting to MODEL_BACKEND.
+    The fake backend reads FAKE_LATENCY, FAKE_JITTER, FAKE_ERROR_RATE and FAKE_MALFORMED_RATE.
+    """
+    name = (name or os.getenv("MODEL_BACKEND", "gemini")).lower()
+
+    if name == 'gemini':
+        return GeminiBackend(**kwargs)
+    if name == 'fake':
+        options = {
+            "latency": float(os.getenv("FAKE_LATENCY", "0")),
+            "jitter": float(os.getenv("FAKE_JITTER", "0")),
+            "error_rate": float(os.getenv("FAKE_ERROR_RATE", "0")),
+            "malformed_rate": float(os.getenv("FAKE_MALFORMED_RATE", "0")),
+        }
+        options.update(kwargs)
+        return FakeBackend(**options)
+    raise ValueError(f"Unknown model backend: {name}")
@@ -0,0 +1,109 @@
+import os
+import re
+
+# A fresh reader every N pages: pypdf keeps every object it has resolved,
+# so a single reader over a 500-page bundle grows with the whole file
+PAGES_PER_READER = int(os.getenv("BUNDLE_PAGES_PER_READER", "50"))
+# Safety net when no boundary is detected: never hold more than this many pages of one copy
+MAX_PAGES_PER_COPY = int(os.getenv("BUNDLE_MAX_PAGES_PER_COPY", "40"))
+
+# Header lines that open a new student copy ("Nom : ...", "Étudiant : ...", "Matricule : ...")
+STUDENT_MARKER_PATTERN = re.compile(
+    r'(?im)^[ \t]*(?:nom(?:\s+et\s+pr[ée]nom)?|pr[ée]nom\s+et\s+nom|[ée]tudiant(?:e)?|[ée]l[èe]ve|'
+    r'student(?:\s+name)?|name|matricule|n°\s*[ée]tudiant|student\s+id|copie\s+n°?)\s*[:\-]\s*(\S.*)$'
+)
+# How far into a page a marker may appear to count as a copy header
+MARKER_SEARCH_CHARS = 600
+
+
+def iter_pdf_pages(source, pages_per_reader=PAGES_PER_READER):
+    """
+    Yield the text of each page of a PDF (path or seekable binary file), one at a time.
+    Only the current window of pages is ever parsed, so memory does not grow with the bundle.
+    """
+    # Imported here: PDF parsing is only needed by the upload endpoint
+    from pypdf import PdfReader
+
+    stream = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    try:
+        page_count = len(PdfReader(stream).pages)
+        for start in range(0, page_count, pages_per_reader):
+            stream.seek(0)
+            reader = PdfReader(stream)
+            for number in range(start, min(start + pages_per_reader, page_count)):
+                yield reader.pages[number].extract_text() or ""
+            del reader
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+class StudentCopySplitter:
+    """
+    Cuts a stream of page texts into student copies.
+    A copy starts on a page whose header carries a student marker (or matches
+    `boundary_pattern`), or every `pages_per_copy` pages when that is given.
+    feed() returns the copies completed by a page; finish() flushes the last one.
+    Each copy is {"index", "student", "first_page", "last_page", "text"}.
+    """
+
+    def __init__(self, pages_per_copy=None, boundary_pattern=None, max_pages_per_copy=MAX_PAGES_PER_COPY):
+        self.pages_per_copy = pages_per_copy
+        self.boundary_pattern = re.compile(boundary_pattern, re.IGNORECASE | re.MULTILINE) \
+            if boundary_pattern else STUDENT_MARKER_PATTERN
+        self.max_pages_per_copy = max_pages_per_copy
+        self._pages = []
+        self._student = None
+        self._first_page = 1
+        self._page_number = 0
+        self._count = 0
+
+    def _is_boundary(self, page_text):
+        if self.pages_per_copy:
+            return len(self._pages) >= self.pages_per_copy, None
+        match = self.boundary_pattern.search(page_text[:MARKER_SEARCH_CHARS])
+        if match is None:
+            return len(self._pages) >= self.max_pages_per_copy, None
+        student = match.group(1).strip() if match.groups() and match.group(1) else match.group(0).strip()
+        # Copies that repeat the student header on every page are one copy, not one per page
+        if self._pages and student == self._student:
+            return len(self._pages) >= self.max_pages_per_copy, student
+        return True, student
+
+    def _flush(self):
+        text = "\n".join(self._pages).strip()
+        self._pages = []
+        if not text:
+            return []
+        copy = {
+            "index": self._count,
+            "student": self._student,
+            "first_page": self._first_page,
+            "last_page": self._page_number,
+            "text": text,
+        }
+        self._count += 1
+        return [copy]
+
+    def feed(self, page_text):
+        boundary, student = self._is_boundary(page_text)
+        completed = self._flush() if boundary and self._pages else []
+        self._page_number += 1
+        if not self._pages:
+            self._first_page = self._page_number
+            self._student = student
+        self._pages.append(page_text)
+        return completed
+
+    def finish(self):
+        return self._flush()
+
+
+def iter_student_copies(pages, pages_per_copy=None, boundary_pattern=None):
+    """Split an iterable of page texts into student copies, yielding each one as soon as it is complete"""
+    splitter = StudentCopySplitter(pages_per_copy=pages_per_copy, boundary_pattern=boundary_pattern)
+    for page_text in pages:
+        for copy in splitter.feed(page_text):
+            yield copy
+    for copy in splitter.finish():
+        yield copy
@@ -4,8 +4,307 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_LEFT, TA_CENTER
 from reportlab.lib import colors
 from reportlab.lib.units import inch
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.graphics.shapes import Drawing
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.pdfbase.pdfmetrics import stringWidth
+import io
+import multiprocessing
 import re
 import os
+import threading
+import time
+from functools import lru_cache
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+
+# Key patterns used to recognise fields in model outputs, in priority order
+KEY_CATEGORY_PATTERNS = {
+    'identification': ['id', 'question', 'name', 'identifier', 'number'],
+    'topic': ['topic', 'subject', 'theme', 'title', 'content'],
+    'score_info': ['score', 'points', 'mark', 'grade', 'total', 'maximum'],
+    'answer': ['answer', 'response', 'solution', 'student'],
+    'breakdown': ['breakdown', 'rubric', 'criteria', 'grading', 'elements'],
+    'feedback': ['feedback', 'comment', 'review', 'evaluation'],
+}
+
+BREAKDOWN_COLUMN_PATTERNS = {
+    'element': ['element', 'criterion', 'rubric', 'part'],
+    'max_points': ['max', 'maximum', 'total'],
+    'score': ['score', 'student', 'points', 'earned'],
+    'justification': ['justification', 'reason', 'comment', 'feedback'],
+}
+
+MAX_POINTS_PATTERNS = ['max', 'maximum', 'total']
+STUDENT_SCORE_PATTERNS = ['student', 'actual', 'achieved', 'score']
+
+_NUMBER_PATTERN = re.compile(r'\d+\.?\d*')
+
+# Compiled plans are shared by every generator (and every report) in the process
+_key_plans = {}
+_breakdown_plans = {}
+
+
+def _pattern_rank(key, patterns):
+    """Index of the first pattern contained in key, or None"""
+    key_lower = key.lower()
+    for rank, pattern in enumerate(patterns):
+        if pattern in key_lower:
+            return rank
+    return None
+
+
+def _rank_keys(keys, patterns):
+    """Keys matching any pattern, best pattern first (ties broken by name for a stable plan)"""
+    ranked = []
+    for key in keys:
+        rank = _pattern_rank(key, patterns)
+        if rank is not None:
+            ranked.append((rank, key))
+    return [key for _, key in sorted(ranked)]
+
+
+def _numeric_value(value):
+    """Number from an int/float or the first number found in a string, else None"""
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        numbers = _NUMBER_PATTERN.findall(value)
+        if numbers:
+            return float(numbers[0])
+    return None
+
+
+class KeyPlan:
+    """
+    Precomputed field accessors for one question schema (one set of keys).
+    Built once per distinct key set; extracting a question is then plain dict access.
+    """
+
+    def __init__(self, keys):
+        self.key_categories = {
+            category: {'patterns': patterns, 'keys': _rank_keys(keys, patterns)}
+            for category, patterns in KEY_CATEGORY_PATTERNS.items()
+        }
+        categories = {category: info['keys'] for category, info in self.key_categories.items()}
+        score_keys = categories['score_info']
+
+        self.question_id_key = next(iter(categories['identification']), None)
+        self.topic_key = next(iter(categories['topic']), None)
+        self.answer_key = next(iter(categories['answer']), None)
+        self.feedback_key = next(iter(categories['feedback']), None)
+        self.breakdown_keys = categories['breakdown']
+        self.max_points_keys = [key for pattern in MAX_POINTS_PATTERNS for key in score_keys
+                                if pattern in key.lower()]
+        self.student_score_keys = [key for pattern in STUDENT_SCORE_PATTERNS for key in score_keys
+                                   if pattern in key.lower()]
+
+    @staticmethod
+    def _first_number(item, keys):
+        for key in keys:
+            value = _numeric_value(item[key])
+            if value is not None:
+                return value
+        return 0
+
+    def extract(self, item):
+        """Extract question information from an item having this plan's keys"""
+        breakdown = next((item[key] for key in self.breakdown_keys if isinstance(item[key], list)), [])
+        return {
+            'question_id': str(item[self.question_id_key]) if self.question_id_key else "Unknown Question",
+            'topic': str(item[self.topic_key]) if self.topic_key else "No Topic",
+            'max_points': self._first_number(item, self.max_points_keys),
+            'student_score': self._first_number(item, self.student_score_keys),
+            'student_answer': str(item[self.answer_key]) if self.answer_key else "No answer provided",
+            'grading_breakdown': breakdown,
+            'overall_feedback': str(item[self.feedback_key]) if self.feedback_key else "No feedback provided",
+        }
+
+
+class BreakdownPlan:
+    """Precomputed column mapping for one grading-breakdown row schema"""
+
+    def __init__(self, keys):
+        structure = {column: [] for column in BREAKDOWN_COLUMN_PATTERNS}
+        ranked = {column: [] for column in BREAKDOWN_COLUMN_PATTERNS}
+        for key in keys:
+            # Each key belongs to the first column whose patterns match it
+            for column, patterns in BREAKDOWN_COLUMN_PATTERNS.items():
+                rank = _pattern_rank(key, patterns)
+                if rank is not None:
+                    ranked[column].append((rank, key))
+                    break
+        for column, entries in ranked.items():
+            structure[column] = [key for _, key in sorted(entries)]
+        self.structure = structure
+
+
+def get_key_plan(item):
+    """Memoized KeyPlan for the item's key set"""
+    signature = frozenset(item)
+    plan = _key_plans.get(signature)
+    if plan is None:
+        plan = _key_plans[signature] = KeyPlan(signature)
+    return plan
+
+
+def get_breakdown_plan(row):
+    """Memoized BreakdownPlan for the breakdown row's key set"""
+    signature = frozenset(row)
+    plan = _breakdown_plans.get(signature)
+    if plan is None:
+        plan = _breakdown_plans[signature] = BreakdownPlan(signature)
+    return plan
+
+
+class LazyStory(list):
+    """
+    List of flowables that refills itself from an iterator as doc.build consumes it.
+    Only `window` flowables are alive at any time; the finished pages are held
+    by the canvas until it saves, which is why streamed reports are built in
+    parts (see generate_pdf_stream). doc.build only needs len(), indexing, slicing and
+    deletion at the front, which the list base class provides.
+    """
+
+    def __init__(self, flowables, window=64):
+        super().__init__()
+        self._source = iter(flowables)
+        self._window = window
+        self._exhausted = False
+        self._refill()
+
+    def _refill(self):
+        while not self._exhausted and super().__len__() < self._window:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._exhausted = True
+
+    def __len__(self):
+        self._refill()
+        return super().__len__()
+
+
+class PdfPartWriter:
+    """
+    Concatenate whole PDF documents (the parts of a streamed report) into one
+    output stream as they arrive. Each part's objects are renumbered and written
+    out at once; only their byte offsets and the page object numbers are kept
+    until close() writes the page tree, catalog and cross-reference table.
+    """
+
+    PAGES_ID = 1
+    CATALOG_ID = 2
+
+    def __init__(self, out):
+        self._out = out
+        self._position = 0
+        self._offsets = {}
+        self._next_id = 3
+        self._page_ids = []
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self._out.write(data)
+        self._position += len(data)
+
+    def _allocate(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, obj):
+        buffer = io.BytesIO()
+        obj.write_to_stream(buffer)
+        self._offsets[obj_id] = self._position
+        self._write(f"{obj_id} 0 obj\n".encode('ascii') + buffer.getvalue() + b"\nendobj\n")
+
+    def append(self, pdf_bytes):
+        """Append every page of a PDF document; returns how many pages it had"""
+        # Imported here: only streamed reports are reassembled
+        from pypdf import PdfReader
+        from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject
+
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        new_ids = {}
+        pending = []
+
+        def reference(indirect):
+            key = (indirect.idnum, indirect.generation)
+            if key not in new_ids:
+                new_ids[key] = self._allocate()
+                pending.append((new_ids[key], indirect))
+            return IndirectObject(new_ids[key], 0, None)
+
+        def renumber(obj):
+            # Raw dict/list access: pypdf's accessors would resolve the references
+            if isinstance(obj, IndirectObject):
+                return reference(obj)
+            if isinstance(obj, DictionaryObject):
+                for key, value in list(dict.items(obj)):
+                    dict.__setitem__(obj, key, renumber(value))
+            elif isinstance(obj, ArrayObject):
+                for i, value in enumerate(list.__iter__(obj)):
+                    list.__setitem__(obj, i, renumber(value))
+            return obj
+
+        # Pages first, so links between them keep pointing at the copies written here
+        pages = list(reader.pages)
+        page_ids = []
+        for page in pages:
+            page_id = self._allocate()
+            new_ids[(page.indirect_reference.idnum, page.indirect_reference.generation)] = page_id
+            page_ids.append(page_id)
+
+        for page, page_id in zip(pages, page_ids):
+            # Inherited attributes (resources, media box) are already copied onto each page by pypdf
+            dict.pop(page, NameObject("/Parent"), None)
+            renumber(page)
+            dict.__setitem__(page, NameObject("/Parent"), IndirectObject(self.PAGES_ID, 0, None))
+            self._write_object(page_id, page)
+            while pending:
+                obj_id, indirect = pending.pop()
+                self._write_object(obj_id, renumber(indirect.get_object()))
+        self._page_ids.extend(page_ids)
+        return len(page_ids)
+
+    def close(self, title=None):
+        """Write the page tree, catalog and trailer; the output is a complete PDF afterwards"""
+        from pypdf.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject,
+                                   TextStringObject)
+
+        self._write_object(self.PAGES_ID, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(i, 0, None) for i in self._page_ids),
+            NameObject("/Count"): NumberObject(len(self._page_ids)),
+        }))
+        self._write_object(self.CATALOG_ID, DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(self.PAGES_ID, 0, None),
+        }))
+        trailer = {NameObject("/Root"): IndirectObject(self.CATALOG_ID, 0, None)}
+        if title:
+            info_id = self._allocate()
+            self._write_object(info_id, DictionaryObject({NameObject("/Title"): TextStringObject(title)}))
+            trailer[NameObject("/Info")] = IndirectObject(info_id, 0, None)
+        trailer[NameObject("/Size")] = NumberObject(self._next_id)
+
+        xref_position = self._position
+        lines = [f"xref\n0 {self._next_id}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self._offsets[obj_id]:010d} 00000 n \n" for obj_id in range(1, self._next_id))
+        self._write("".join(lines).encode('ascii') + b"trailer\n")
+        buffer = io.BytesIO()
+        DictionaryObject(trailer).write_to_stream(buffer)
+        self._write(buffer.getvalue() + f"\nstartxref\n{xref_position}\n%%EOF\n".encode('ascii'))
+
+
+# 'platypus' (flowables, the reference layout) or 'fast' (FastReportRenderer)
+DEFAULT_RENDERER = os.getenv("PDF_RENDERER", "platypus")
+# Streamed reports are laid out this many questions at a time, each part flushed to the output
+PDF_STREAM_CHUNK_ITEMS = int(os.getenv("PDF_STREAM_CHUNK_ITEMS", "200"))
 
 
 class SmartPDFGenerator:
@@ -62,147 +361,80 @@ class SmartPDFGenerator:
 
     def ai_detect_keys(self, data):
         """
-        Use pattern matching and AI-like logic to detect key types
+        Use pattern matching and AI-like logic to detect key types.
+        Detection is compiled once per key set (see get_key_plan) and cached.
         """
-        key_categories = {
-            'identification': {
-                'patterns': ['id', 'question', 'name', 'identifier', 'number'],
-                'keys': []
-            },
-            'topic': {
-                'patterns': ['topic', 'subject', 'theme', 'title', 'content'],
-                'keys': []
-            },
-            'score_info': {
-                'patterns': ['score', 'points', 'mark', 'grade', 'total', 'maximum'],
-                'keys': []
-            },
-            'answer': {
-                'patterns': ['answer', 'response', 'solution', 'student'],
-                'keys': []
-            },
-            'breakdown': {
-                'patterns': ['breakdown', 'rubric', 'criteria', 'grading', 'elements'],
-                'keys': []
-            },
-            'feedback': {
-                'patterns': ['feedback', 'comment', 'review', 'evaluation'],
-                'keys': []
-            }
-        }
-
-        # Analyze first item to detect keys
         if data and len(data) > 0:
-            first_item = data[0]
-
-            for key in first_item.keys():
-                key_lower = key.lower()
-
-                # Check each category
-                for category, info in key_categories.items():
-                    for pattern in info['patterns']:
-                        if pattern in key_lower:
-                            key_categories[category]['keys'].append(key)
-                            break
-
-        return key_categories
-
-    def extract_question_info(self, item, key_categories):
-        """Extract question information using detected keys"""
-        info = {}
-
-        # Extract identification
-        for key in key_categories['identification']['keys']:
-            if key in item:
-                info['question_id'] = str(item[key])
-                break
-        else:
-            info['question_id'] = "Unknown Question"
-
-        # Extract topic
-        for key in key_categories['topic']['keys']:
-            if key in item:
-                info['topic'] = str(item[key])
-                break
-        else:
-            info['topic'] = "No Topic"
-
-        # Extract scores
-        score_keys = key_categories['score_info']['keys']
-        info['max_points'] = self.find_numeric_value(item, score_keys, ['max', 'maximum', 'total'])
-        info['student_score'] = self.find_numeric_value(item, score_keys, ['student', 'actual', 'achieved', 'score'])
-
-        # Extract answer
-        for key in key_categories['answer']['keys']:
-            if key in item:
-                info['student_answer'] = str(item[key])
-                break
-        else:
-            info['student_answer'] = "No answer provided"
+            return get_key_plan(data[0]).key_categories
+        return {category: {'patterns': patterns, 'keys': []}
+                for category, patterns in KEY_CATEGORY_PATTERNS.items()}
 
-        # Extract breakdown
-        for key in key_categories['breakdown']['keys']:
-            if key in item and isinstance(item[key], list):
-                info['grading_breakdown'] = item[key]
-                break
-        else:
-            info['grading_breakdown'] = []
-
-        # Extract feedback
-        for key in key_categories['feedback']['keys']:
-            if key in item:
-                info['overall_feedback'] = str(item[key])
-                break
-        else:
-            info['overall_feedback'] = "No feedback provided"
-
-        return info
+    def extract_question_info(self, item, key_categories=None):
+        """
+        Extract question information using the compiled plan for this item's keys.
+        `key_categories` is kept for backward compatibility; each item always uses
+        its own plan so lists mixing several schemas are read correctly.
+        """
+        return get_key_plan(item).extract(item)
 
     def find_numeric_value(self, item, score_keys, patterns):
         """Find numeric values based on key patterns"""
         for pattern in patterns:
             for key in score_keys:
                 if pattern in key.lower() and key in item:
-                    value = item[key]
-                    if isinstance(value, (int, float)):
+                    value = _numeric_value(item[key])
+                    if value is not None:
                         return value
-                    elif isinstance(value, str):
-                        # Try to extract number from string
-                        numbers = re.findall(r'\d+\.?\d*', value)
-                        if numbers:
-                            return float(numbers[0])
         return 0
 
     def analyze_breakdown_structure(self, breakdown_item):
-        """Analyze the structure of grading breakdown items"""
+        """Analyze the structure of grading breakdown items (cached per row schema)"""
         if not breakdown_item:
             return {}
+        return get_breakdown_plan(breakdown_item[0]).structure
 
-        structure = {
-            'element': [],
-            'max_points': [],
-            'score': [],
-            'justification': []
-        }
-
-        first_element = breakdown_item[0] if breakdown_item else {}
+    def breakdown_columns(self, row):
+        """Keys to use for the element / max points / score / justification columns of a row"""
+        structure = get_breakdown_plan(row).structure
+        element_key = structure['element'][0] if structure['element'] else next(iter(row), "Unknown")
+        max_points_key = structure['max_points'][0] if structure['max_points'] else self.find_key_by_type(
+            row, 'max_points')
+        score_key = structure['score'][0] if structure['score'] else self.find_key_by_type(row, 'score')
+        justification_key = structure['justification'][0] if structure['justification'] else self.find_key_by_type(
+            row, 'justification')
+        return element_key, max_points_key, score_key, justification_key
 
-        for key in first_element.keys():
-            key_lower = key.lower()
+    def _open_target(self, filename):
+        """
+        Resolve the output target: a path (parent directory created) or a binary
+        buffer. None means an in-memory buffer whose bytes are returned.
+        """
+        if filename is None:
+            return io.BytesIO()
+        if hasattr(filename, 'write'):
+            return filename
 
-            if any(pattern in key_lower for pattern in ['element', 'criterion', 'rubric', 'part']):
-                structure['element'].append(key)
-            elif any(pattern in key_lower for pattern in ['max', 'maximum', 'total']):
-                structure['max_points'].append(key)
-            elif any(pattern in key_lower for pattern in ['score', 'student', 'points', 'earned']):
-                structure['score'].append(key)
-            elif any(pattern in key_lower for pattern in ['justification', 'reason', 'comment', 'feedback']):
-                structure['justification'].append(key)
+        # Ensure output directory exists
+        out_dir = os.path.dirname(filename) or "."
+        if out_dir and not os.path.exists(out_dir):
+            os.makedirs(out_dir, exist_ok=True)
+        return filename
 
-        return structure
+    def _close_target(self, target):
+        """Return the path for file targets, the PDF bytes for buffer targets"""
+        if isinstance(target, str):
+            print(f"PDF generated successfully: {target}")
+            return target
+        return target.getvalue() if hasattr(target, 'getvalue') else None
 
-    def generate_pdf(self, data, filename="grading_report.pdf"):
-        """Main function to generate PDF from variable JSON data"""
+    def generate_pdf(self, data, filename="grading_report.pdf", renderer=None):
+        """
+        Main function to generate PDF from variable JSON data.
+        `filename` may also be a binary buffer, or None to render in memory;
+        the PDF bytes are returned instead of the path in that case.
+        renderer='fast' draws the standard layout directly on the canvas
+        (FastReportRenderer); the default comes from PDF_RENDERER.
+        """
         if not data:
             raise ValueError("No data provided")
 
@@ -220,39 +452,124 @@ class SmartPDFGenerator:
         else:
             raise TypeError("Unsupported data type for PDF generation. Expect dict or list of dicts.")
 
-        # Ensure output directory exists
-        out_dir = os.path.dirname(filename) or "."
-        if out_dir and not os.path.exists(out_dir):
-            os.makedirs(out_dir, exist_ok=True)
+        target = self._open_target(filename)
 
-        # Analyze the data structure
-        key_categories = self.ai_detect_keys(data)
+        if (renderer or DEFAULT_RENDERER) == 'fast':
+            # A renderer per call: it holds the canvas and cursor of one document, and this
+            # generator is shared by request threads (word widths are cached module-wide)
+            with metrics.span('pdf_fast_render'):
+                FastReportRenderer(self).render(data, target)
+            return self._close_target(target)
 
-        # Create document
-        doc = SimpleDocTemplate(filename, pagesize=letter)
+        # Create document (invariant: identical data gives identical bytes)
+        doc = SimpleDocTemplate(target, pagesize=letter, invariant=1)
         story = []
 
-        # Title (French)
-        story.append(Paragraph("Rapport d'évaluation généré par l'IA", self.title_style))
-        story.append(Spacer(1, 0.3 * inch))
+        with metrics.span('pdf_story'):
+            # Title (French)
+            story.append(Paragraph("Rapport d'évaluation généré par l'IA", self.title_style))
+            story.append(Spacer(1, 0.3 * inch))
 
-        for item in data:
-            # Extract information using AI detection
-            question_info = self.extract_question_info(item, key_categories)
+            for item in data:
+                # Extract information using the compiled plan for this item's schema
+                question_info = self.extract_question_info(item)
 
-            # Analyze breakdown structure
-            breakdown_structure = self.analyze_breakdown_structure(question_info['grading_breakdown'])
+                # Analyze breakdown structure
+                breakdown_structure = self.analyze_breakdown_structure(question_info['grading_breakdown'])
 
-            # Generate question section
-            self.add_question_section(story, question_info, breakdown_structure)
+                # Generate question section
+                self.add_question_section(story, question_info, breakdown_structure)
 
-            # Add space between questions
-            story.append(Spacer(1, 0.4 * inch))
+                # Add space between questions
+                story.append(Spacer(1, 0.4 * inch))
 
         # Build PDF
-        doc.build(story)
-        print(f"PDF generated successfully: {filename}")
-        return filename
+        with metrics.span('pdf_build'):
+            doc.build(story)
+        return self._close_target(target)
+
+    def _iter_correction_items(self, items):
+        """Flatten an iterable of question dicts and/or grading results with 'corrections'"""
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get('corrections'), list):
+                yield from item['corrections']
+            elif isinstance(item, dict):
+                yield item
+            else:
+                raise TypeError("Unsupported item type for PDF generation. Expect dicts.")
+
+    def _iter_story(self, items, title=None):
+        """Yield flowables one question at a time instead of building the whole story"""
+        if title:
+            yield Paragraph(self._escape_html(title), self.title_style)
+            yield Spacer(1, 0.3 * inch)
+
+        for item in items:
+            question_info = self.extract_question_info(item)
+            breakdown_structure = self.analyze_breakdown_structure(question_info['grading_breakdown'])
+
+            section = []
+            self.add_question_section(section, question_info, breakdown_structure)
+            section.append(Spacer(1, 0.4 * inch))
+            yield from section
+
+    def _draw_page_decorations(self, canvas, doc, first_page=1):
+        """Running header and page number, identical on every page of a streamed report"""
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.setFillColor(colors.grey)
+        canvas.drawString(doc.leftMargin, doc.pagesize[1] - 0.5 * inch, doc.title)
+        canvas.drawRightString(doc.pagesize[0] - doc.rightMargin, 0.5 * inch, f"Page {doc.page + first_page - 1}")
+        canvas.restoreState()
+
+    def _render_part(self, items, title, first_page, window):
+        """One part of a streamed report (its title only on the first part), as PDF bytes"""
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter, title=title, pageCompression=1, invariant=1)
+
+        def decorate(canvas, doc):
+            self._draw_page_decorations(canvas, doc, first_page)
+
+        story = LazyStory(self._iter_story(items, title if first_page == 1 else None), window=window)
+        doc.build(story, onFirstPage=decorate, onLaterPages=decorate)
+        return buffer.getvalue()
+
+    def generate_pdf_stream(self, items, filename="grading_report.pdf",
+                            title="Rapport d'évaluation généré par l'IA", window=64,
+                            chunk_items=PDF_STREAM_CHUNK_ITEMS):
+        """
+        Streaming variant of generate_pdf for very large (e.g. class-wide) reports.
+        `items` may be any iterator/generator of question dicts or grading results.
+        They are laid out `chunk_items` at a time, each part rendered on its own and
+        appended to the output right away (PdfPartWriter), so peak memory is that of
+        one part whatever the report size. Page numbers run on across parts; each
+        part starts on a new page. Like generate_pdf, `filename` may be a binary
+        buffer or None (returns bytes, the only case held in memory).
+        """
+        items = self._iter_correction_items(items)
+        try:
+            first = next(items)
+        except StopIteration:
+            raise ValueError("No data provided")
+        items = chain([first], items)
+
+        target = self._open_target(filename)
+        out = open(target, 'wb') if isinstance(target, str) else target
+        try:
+            writer = PdfPartWriter(out)
+            page = 1
+            # Story building happens lazily inside doc.build here, so both are timed together
+            with metrics.span('pdf_build'):
+                while True:
+                    part = list(islice(items, chunk_items))
+                    if not part:
+                        break
+                    page += writer.append(self._render_part(part, title, page, window))
+            writer.close(title)
+        finally:
+            if out is not target:
+                out.close()
+        return self._close_target(target)
 
     def add_question_section(self, story, question_info, breakdown_structure):
         """Add a complete question section to the PDF"""
@@ -316,14 +633,6 @@ class SmartPDFGenerator:
         if not breakdown_data:
             return
 
-        # Determine which keys to use for each column
-        element_key = structure['element'][0] if structure['element'] else list(breakdown_data[0].keys())[0]
-        max_points_key = structure['max_points'][0] if structure['max_points'] else self.find_key_by_type(
-            breakdown_data[0], 'max_points')
-        score_key = structure['score'][0] if structure['score'] else self.find_key_by_type(breakdown_data[0], 'score')
-        justification_key = structure['justification'][0] if structure['justification'] else self.find_key_by_type(
-            breakdown_data[0], 'justification')
-
         # Create table headers (French)
         headers = [
             Paragraph("<b>Critère</b>", self.normal_style),
@@ -336,6 +645,8 @@ class SmartPDFGenerator:
 
         # Add data rows with Paragraph objects for proper text wrapping
         for item in breakdown_data:
+            # Rows are mapped individually so mixed row schemas still land in the right columns
+            element_key, max_points_key, score_key, justification_key = self.breakdown_columns(item)
             row = [
                 Paragraph(self._escape_html(str(item.get(element_key, ''))), self.normal_style),
                 Paragraph(str(item.get(max_points_key, '')), self.normal_style),
@@ -363,6 +674,90 @@ class SmartPDFGenerator:
         ]))
         story.append(breakdown_table)
 
+    def add_class_summary(self, story, summary):
+        """
+        Add the class summary section (see analytics.ClassAnalytics.summary):
+        overall statistics, a histogram of totals and one row per question/criterion.
+        """
+        def fmt(value, pattern="{:.2f}"):
+            return "–" if value is None else pattern.format(value)
+
+        totals = summary.get('totals', {})
+        percentiles = totals.get('percentiles', {})
+        pass_rate = totals.get('pass_rate')
+        story.append(Paragraph("Synthèse de la classe", self.heading_style))
+        story.append(Paragraph(
+            f"<b>Copies :</b> {summary.get('students', 0)} &nbsp;&nbsp; "
+            f"<b>Moyenne :</b> {fmt(totals.get('mean'))} / {fmt(totals.get('max_total'), '{:g}')} &nbsp;&nbsp; "
+            f"<b>Médiane :</b> {fmt(percentiles.get('p50'))} &nbsp;&nbsp; "
+            f"<b>Écart-type :</b> {fmt(totals.get('std'))} &nbsp;&nbsp; "
+            f"<b>Min / Max :</b> {fmt(totals.get('min'), '{:g}')} / {fmt(totals.get('max'), '{:g}')} &nbsp;&nbsp; "
+            f"<b>Taux de réussite :</b> {fmt(pass_rate * 100 if pass_rate is not None else None, '{:.0f} %')}",
+            self.normal_style
+        ))
+        story.append(Spacer(1, 0.15 * inch))
+
+        histogram = summary.get('histogram', {})
+        counts = histogram.get('counts') or []
+        edges = histogram.get('edges') or []
+        if counts and any(counts):
+            story.append(Paragraph("Répartition des notes (% du total)", self.subheading_style))
+            drawing = Drawing(6.5 * inch, 1.8 * inch)
+            chart = VerticalBarChart()
+            chart.x, chart.y = 0.4 * inch, 0.3 * inch
+            chart.width, chart.height = 5.9 * inch, 1.35 * inch
+            chart.data = [counts]
+            chart.categoryAxis.categoryNames = [f"{edges[i]:g}–{edges[i + 1]:g}" for i in range(len(counts))]
+            chart.categoryAxis.labels.fontSize = 7
+            chart.valueAxis.labels.fontSize = 7
+            chart.valueAxis.valueMin = 0
+            chart.bars[0].fillColor = colors.lightblue
+            drawing.add(chart)
+            story.append(drawing)
+
+        headers = ["Question / critère", "Moy.", "Max", "P25", "Médiane", "P75", "Difficulté", "Discrim."]
+        rows = [headers]
+        for item in summary.get('items', []):
+            item_percentiles = item.get('percentiles', {})
+            rows.append([
+                Paragraph(self._escape_html(item.get('item_id', '')), self.normal_style),
+                fmt(item.get('mean')),
+                fmt(item.get('max_points'), '{:g}'),
+                fmt(item_percentiles.get('p25'), '{:g}'),
+                fmt(item_percentiles.get('p50'), '{:g}'),
+                fmt(item_percentiles.get('p75'), '{:g}'),
+                fmt(item.get('difficulty')),
+                fmt(item.get('discrimination')),
+            ])
+        table = Table(rows, colWidths=[2.0 * inch] + [0.55 * inch] * 3 + [0.75 * inch, 0.55 * inch]
+                      + [0.75 * inch] * 2, repeatRows=1)
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+        ]))
+        story.append(Spacer(1, 0.15 * inch))
+        story.append(table)
+        story.append(Paragraph(
+            "Difficulté : part moyenne des points obtenus (1 = tous les points). "
+            "Discrimination : corrélation entre la question et le reste de la copie.",
+            self.styles['Italic']
+        ))
+
+    def generate_class_report(self, summary, filename="class_report.pdf"):
+        """Render a class summary alone; same target handling as generate_pdf"""
+        target = self._open_target(filename)
+        doc = SimpleDocTemplate(target, pagesize=letter, invariant=1)
+        story = [Paragraph("Rapport de classe", self.title_style), Spacer(1, 0.2 * inch)]
+        self.add_class_summary(story, summary)
+        with metrics.span('pdf_build'):
+            doc.build(story)
+        return self._close_target(target)
+
     def find_key_by_type(self, item, key_type):
         """Fallback method to find keys by value type"""
         for key, value in item.items():
@@ -375,6 +770,296 @@ class SmartPDFGenerator:
         return list(item.keys())[0] if item else "Unknown"
 
 
+@lru_cache(maxsize=65536)
+def _text_width(text, font_name, font_size):
+    """Cached string width: report text repeats the same words over and over"""
+    return stringWidth(text, font_name, font_size)
+
+
+class FastReportRenderer:
+    """
+    Direct-canvas renderer for the standard correction report.
+    Produces the same sections as add_question_section/add_breakdown_table
+    (title, question header, info table, answer, breakdown grid, feedback) but
+    wraps text with cached word widths and draws straight onto the canvas,
+    skipping platypus flowable, table and paragraph layout machinery.
+    """
+
+    PAGE_WIDTH, PAGE_HEIGHT = letter
+    # Same frame as SimpleDocTemplate: 1 inch margins + 6pt frame padding
+    LEFT = inch + 6
+    RIGHT = PAGE_WIDTH - inch - 6
+    TOP = PAGE_HEIGHT - inch - 6
+    BOTTOM = inch + 6
+
+    BASIC_COL_WIDTHS = (1.8 * inch, 4.5 * inch)
+    BREAKDOWN_COL_WIDTHS = (2.0 * inch, 0.7 * inch, 0.6 * inch, 3.4 * inch)
+    BREAKDOWN_HEADERS = ("Critère", "Points max", "Score", "Justification")
+
+    def __init__(self, generator):
+        self.generator = generator
+        # (font, size, leading, space_before, space_after, color) taken from the platypus styles
+        self.title = self._style(generator.title_style)
+        self.heading = self._style(generator.heading_style)
+        self.subheading = self._style(generator.subheading_style)
+        self.normal = self._style(generator.normal_style)
+        self.y = self.TOP
+        self.canvas = None
+
+    @staticmethod
+    def _style(style):
+        return (style.fontName, style.fontSize, style.leading, style.spaceBefore, style.spaceAfter,
+                style.textColor)
+
+    def wrap(self, text, font_name, font_size, width):
+        """Greedy word wrap using cached word widths"""
+        lines = []
+        space = _text_width(' ', font_name, font_size)
+        for paragraph in str(text).split('\n'):
+            line, line_width = [], 0.0
+            for word in paragraph.split():
+                word_width = _text_width(word, font_name, font_size)
+                if word_width > width:
+                    # Hard-break words wider than the column
+                    if line:
+                        lines.append(' '.join(line))
+                        line, line_width = [], 0.0
+                    chunk = ''
+                    for char in word:
+                        if _text_width(chunk + char, font_name, font_size) > width and chunk:
+                            lines.append(chunk)
+                            chunk = ''
+                        chunk += char
+                    line, line_width = [chunk], _text_width(chunk, font_name, font_size)
+                    continue
+                needed = word_width if not line else line_width + space + word_width
+                if line and needed > width:
+                    lines.append(' '.join(line))
+                    line, line_width = [word], word_width
+                else:
+                    line.append(word)
+                    line_width = needed
+            if line:
+                lines.append(' '.join(line))
+        return lines
+
+    # -- page handling -----------------------------------------------------
+
+    def new_page(self):
+        self.canvas.showPage()
+        self.y = self.TOP
+
+    def ensure_space(self, height):
+        if self.y - height < self.BOTTOM and self.y < self.TOP:
+            self.new_page()
+
+    def space(self, height):
+        if self.y - height < self.BOTTOM:
+            self.new_page()
+        else:
+            self.y -= height
+
+    # -- primitives --------------------------------------------------------
+
+    def draw_lines(self, lines, style, align='left'):
+        font_name, font_size, leading, _, _, color = style
+        self.canvas.setFillColor(color)
+        self.canvas.setFont(font_name, font_size)
+        for line in lines:
+            self.ensure_space(leading)
+            baseline = self.y - font_size
+            if align == 'center':
+                self.canvas.drawCentredString((self.LEFT + self.RIGHT) / 2, baseline, line)
+            else:
+                self.canvas.drawString(self.LEFT, baseline, line)
+            self.y -= leading
+
+    def paragraph(self, text, style, align='left'):
+        font_name, font_size, leading, space_before, space_after, _ = style
+        lines = self.wrap(text, font_name, font_size, self.RIGHT - self.LEFT)
+        if self.y < self.TOP:
+            self.space(space_before)
+        # Keep at least the first line with its heading space
+        self.ensure_space(leading)
+        self.draw_lines(lines, style, align)
+        self.space(space_after)
+
+    def table(self, rows, col_widths, fonts, padding, header_background=None, row_backgrounds=None,
+              grid=False, header_bottom_padding=None):
+        """Rows of plain strings; wrapped per cell, split between rows across pages"""
+        left_pad, right_pad, top_pad, bottom_pad = padding
+        _, font_size, leading = fonts[0]
+        for row_index, row in enumerate(rows):
+            is_header = header_background is not None and row_index == 0
+            font_name = fonts[1][0] if is_header else fonts[0][0]
+            cells = [self.wrap(text, font_name, font_size, width - left_pad - right_pad)
+                     for text, width in zip(row, col_widths)]
+            row_bottom_pad = header_bottom_padding if is_header and header_bottom_padding else bottom_pad
+            height = max(len(lines) for lines in cells) * leading + top_pad + row_bottom_pad
+            if self.y - height < self.BOTTOM and self.y < self.TOP:
+                self.new_page()
+
+            top = self.y
+            # platypus centres tables in the frame
+            left = (self.LEFT + self.RIGHT - sum(col_widths)) / 2
+            background = header_background if is_header else None
+            if background is None and row_backgrounds:
+                background = row_backgrounds[(row_index - (1 if header_background else 0)) % len(row_backgrounds)]
+            if background is not None:
+                self.canvas.setFillColor(background)
+                self.canvas.rect(left, top - height, sum(col_widths), height, stroke=0, fill=1)
+
+            self.canvas.setFillColor(colors.black)
+            self.canvas.setFont(font_name, font_size)
+            x = left
+            for lines, width in zip(cells, col_widths):
+                baseline = top - top_pad - font_size
+                for line in lines:
+                    self.canvas.drawString(x + left_pad, baseline, line)
+                    baseline -= leading
+                if grid:
+                    self.canvas.rect(x, top - height, width, height, stroke=1, fill=0)
+                x += width
+            self.y = top - height
+
+    # -- report sections ---------------------------------------------------
+
+    def question_section(self, info):
+        g = self.generator
+        self.paragraph(f"Question : {info['question_id']}", self.heading)
+
+        basic_info = [
+            ["Sujet :", info['topic']],
+            ["Points maximum :", str(info['max_points'])],
+            ["Note de l'étudiant :", f"{info['student_score']}"],
+        ]
+        if info['max_points'] > 0:
+            percentage = (info['student_score'] / info['max_points']) * 100
+            basic_info.append(["Pourcentage :", f"{percentage:.1f}%"])
+        self.table(basic_info, self.BASIC_COL_WIDTHS, [('Helvetica', 10, 12), ('Helvetica', 10, 12)],
+                   padding=(4, 4, 3, 8))
+        self.space(0.2 * inch)
+
+        self.paragraph("Réponse de l'étudiant :", self.subheading)
+        for para in info['student_answer'].split('\n'):
+            if para.strip():
+                self.paragraph(para, self.normal)
+        self.space(0.2 * inch)
+
+        if info['grading_breakdown']:
+            self.paragraph("Répartition de la notation :", self.heading)
+            rows = [list(self.BREAKDOWN_HEADERS)]
+            for item in info['grading_breakdown']:
+                element_key, max_points_key, score_key, justification_key = g.breakdown_columns(item)
+                rows.append([str(item.get(element_key, '')), str(item.get(max_points_key, '')),
+                             str(item.get(score_key, '')), str(item.get(justification_key, ''))])
+            self.table(rows, self.BREAKDOWN_COL_WIDTHS,
+                       [('Helvetica', 10, 12), ('Helvetica-Bold', 10, 12)], padding=(6, 6, 6, 6),
+                       header_background=colors.lightblue, row_backgrounds=[colors.white, colors.whitesmoke],
+                       grid=True, header_bottom_padding=12)
+            self.space(0.2 * inch)
+
+        self.paragraph("Commentaires généraux :", self.subheading)
+        self.paragraph(info['overall_feedback'], self.normal)
+
+    def render(self, items, target, title="Rapport d'évaluation généré par l'IA"):
+        self.canvas = Canvas(target, pagesize=letter, invariant=1)
+        self.canvas.setLineWidth(1)
+        self.y = self.TOP
+        self.paragraph(title, self.title, align='center')
+        self.space(0.3 * inch)
+        for item in items:
+            self.question_section(self.generator.extract_question_info(item))
+            self.space(0.4 * inch)
+        self.canvas.save()
+
+
+# Per-process generator, built once by _init_worker in each pool process
+_worker_generator = None
+
+
+def _init_worker(generator_class):
+    """Process pool initializer: build fonts/styles once per worker"""
+    global _worker_generator
+    _worker_generator = generator_class()
+
+
+def _render_one(task):
+    """Render a single report inside a worker; never raises so one bad report can't stop the rest"""
+    index, data, path = task
+    start = time.perf_counter()
+    try:
+        _worker_generator.generate_pdf(data, path)
+        return {"index": index, "path": path, "seconds": time.perf_counter() - start, "error": None}
+    except Exception as e:
+        return {"index": index, "path": None, "seconds": time.perf_counter() - start, "error": str(e)}
+
+
+# Long-lived render pools, one per (size, generator class), started on first use
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers, generator_class):
+    """
+    Shared process pool. Workers are spawned, not forked: the server forking
+    them is multithreaded (result store writer, job threads, metrics lock) and a
+    forked child could inherit a lock held at fork time and hang forever.
+    """
+    key = (workers, generator_class)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(generator_class,)
+            )
+        return pool
+
+
+def _discard_pool(workers, generator_class, pool):
+    with _pools_lock:
+        if _pools.get((workers, generator_class)) is pool:
+            del _pools[(workers, generator_class)]
+    pool.shutdown(wait=False)
+
+
+def generate_many(results, out_dir, filenames=None, max_workers=None, generator_class=SmartPDFGenerator):
+    """
+    Render one PDF per grading result across a process pool.
+    Returns, in input order, a dict per report with its path, render time and error (if any).
+    """
+    results = list(results)
+    if filenames is None:
+        filenames = [f"report_{i + 1}.pdf" for i in range(len(results))]
+    if len(filenames) != len(results):
+        raise ValueError("filenames must match the number of results")
+
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(i, data, os.path.join(out_dir, name)) for i, (data, name) in enumerate(zip(results, filenames))]
+    if not tasks:
+        return []
+
+    pool_size = max(1, max_workers or os.cpu_count() or 1)
+    workers = min(pool_size, len(tasks))
+    if workers == 1:
+        # Not worth a round trip to other processes for a single worker
+        _init_worker(generator_class)
+        return [_render_one(task) for task in tasks]
+
+    # Larger chunks amortize pickling overhead for big classes
+    chunksize = max(1, len(tasks) // (workers * 4))
+    for attempt in range(2):
+        pool = _get_pool(pool_size, generator_class)
+        try:
+            return list(pool.map(_render_one, tasks, chunksize=chunksize))
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory): start a fresh pool once
+            _discard_pool(pool_size, generator_class, pool)
+            if attempt:
+                raise
+
+
 # Usage examples with different JSON structures
 def test_with_various_structures(data, output_path="myreport.pdf"):
     generator = SmartPDFGenerator()
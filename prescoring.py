@@ -0,0 +1,190 @@
+import os
+import re
+import unicodedata
+from collections import deque
+
+from core_logic import MemoryCache, compiled_per_rubric, item_max_points, item_question_id, rubric_items
+
+# A copy matching no expected element and with fewer letters/digits than this
+# ('', '-', 'x') is blank: graded 0 without a model call
+PRESCORE_MIN_CHARS = int(os.getenv("PRESCORE_MIN_CHARS", "3"))
+# Compiled matchers kept per rubric (a class shares one rubric)
+PRESCORER_CACHE_SIZE = 64
+
+_LIGATURES = str.maketrans({'œ': 'oe', 'Œ': 'oe', 'æ': 'ae', 'Æ': 'ae', 'ß': 'ss', '’': "'", 'ʼ': "'"})
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+ELEMENT_KEY_WORDS = ('key_element', 'element', 'keyword', 'expected', 'concept', 'mots')
+
+
+def fold_text(text):
+    """
+    Accent-, case- and punctuation-insensitive form of French text:
+    'Théorème de Pythagore' and 'THEOREME  de pythagore!' both become ' theoreme de pythagore '.
+    Words are separated by single spaces, with one at each end so matches can require word boundaries.
+    """
+    text = unicodedata.normalize('NFKD', str(text).translate(_LIGATURES))
+    text = ''.join(char for char in text if not unicodedata.combining(char)).casefold()
+    return f" {_NON_WORD.sub(' ', text).strip()} "
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher: every pattern is found in one linear pass over the text,
+    whatever the number of patterns. Patterns and text must already be folded.
+    """
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        # Breadth-first failure links; outputs inherit those of their failure state
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find_ids(self, text):
+        """Set of the pattern ids occurring in `text`"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+def _element_list(item):
+    """Expected elements of a rubric item (a list, or a comma/semicolon separated string)"""
+    for word in ELEMENT_KEY_WORDS:
+        for key, value in item.items():
+            if word in key.lower():
+                if isinstance(value, str):
+                    value = re.split(r'[;,\n]', value)
+                if isinstance(value, list):
+                    return [str(element).strip() for element in value
+                            if isinstance(element, (str, int, float)) and str(element).strip()]
+    return []
+
+
+class KeywordPrescorer:
+    """
+    Local keyword coverage of a student copy against a rubric.
+    All expected elements of all items go into one automaton, so scoring a copy
+    is a single pass over its text. The result is a provisional score (coverage x
+    max points per item) and hints for the grading prompt, not a grade.
+    """
+
+    def __init__(self, rubric):
+        self.items = []
+        patterns = []
+        self._owners = []
+        for item in rubric_items(rubric):
+            elements = _element_list(item)
+            self.items.append({
+                "question_id": item_question_id(item)[1],
+                "max_points": item_max_points(item),
+                "elements": elements,
+            })
+            for element_index, element in enumerate(elements):
+                folded = fold_text(element)
+                if folded.strip():
+                    patterns.append(folded)
+                    self._owners.append((len(self.items) - 1, element_index))
+        self._matcher = AhoCorasick(patterns)
+
+    def score(self, student_copy):
+        folded = fold_text(student_copy)
+        found = self._matcher.find_ids(folded)
+        hits = [set() for _ in self.items]
+        for pattern_id in found:
+            item_index, element_index = self._owners[pattern_id]
+            hits[item_index].add(element_index)
+
+        items = []
+        for item, item_hits in zip(self.items, hits):
+            elements = item["elements"]
+            coverage = len(item_hits) / len(elements) if elements else None
+            provisional = round(item["max_points"] * coverage * 2) / 2 \
+                if coverage is not None and item["max_points"] is not None else None
+            items.append({
+                "question_id": item["question_id"],
+                "max_points": item["max_points"],
+                "coverage": round(coverage, 3) if coverage is not None else None,
+                "found": [elements[i] for i in sorted(item_hits)],
+                "missing": [element for i, element in enumerate(elements) if i not in item_hits],
+                "provisional_score": provisional,
+            })
+
+        # Only trivially empty copies skip the model, never one where a keyword matched
+        return {
+            "empty": not found and len(folded.replace(' ', '')) < PRESCORE_MIN_CHARS,
+            "items": items,
+            "provisional_total": sum(item["provisional_score"] or 0 for item in items),
+            "max_total": sum(item["max_points"] or 0 for item in items),
+        }
+
+
+_prescorers = MemoryCache(max_entries=PRESCORER_CACHE_SIZE)
+
+
+def get_prescorer(rubric):
+    """KeywordPrescorer for a rubric, compiled once and reused for every copy of the class"""
+    return compiled_per_rubric(_prescorers, rubric, KeywordPrescorer)
+
+
+def prompt_hints(prescore):
+    """Coverage hints appended to the grading prompt (the model still judges the answer)"""
+    lines = []
+    for item in prescore["items"]:
+        if item["coverage"] is None:
+            continue
+        lines.append(
+            f"- {item['question_id']}: found {item['found'] or 'none'}; missing {item['missing'] or 'none'}"
+        )
+    return "\n".join(lines)
+
+
+def blank_grading(rubric, prescore):
+    """Zero grading for a blank copy, shaped like a model grading"""
+    corrections = [{
+        "question_id": item["question_id"],
+        "max_points": item["max_points"],
+        "student_score": 0,
+        "student_answer": "",
+        "grading_breakdown": [{
+            "element": str(item["question_id"]),
+            "max_points": item["max_points"],
+            "score": 0,
+            "justification": "Aucune réponse exploitable."
+        }],
+        "overall_feedback": "Copie vide : notée 0 sans appel au modèle (pré-notation locale)."
+    } for item in prescore["items"]]
+    return {
+        "corrections": corrections,
+        "total_score": 0,
+        "max_total": prescore["max_total"],
+        "prescored": True,
+    }
@@ -0,0 +1,387 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from core_logic import item_max_points, item_question_id, item_score, normalize_text, rubric_items
+
+RESULT_STORE_PATH = os.getenv(
+    "RESULT_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "results.sqlite3")
+)
+# Write-behind batching: at most this many queued writes per transaction, none waiting longer than the interval
+RESULT_STORE_BATCH_SIZE = int(os.getenv("RESULT_STORE_BATCH_SIZE", "500"))
+RESULT_STORE_FLUSH_INTERVAL = float(os.getenv("RESULT_STORE_FLUSH_INTERVAL", "0.2"))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rubrics (
+    exam_hash TEXT PRIMARY KEY,
+    model_name TEXT,
+    rubric TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS gradings (
+    grading_id TEXT PRIMARY KEY,
+    exam_hash TEXT NOT NULL,
+    student_id TEXT,
+    copy_hash TEXT,
+    student_text TEXT,
+    total_score REAL,
+    max_total REAL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    superseded_by TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_gradings_exam ON gradings (exam_hash, created_at, grading_id);
+CREATE INDEX IF NOT EXISTS idx_gradings_student ON gradings (student_id, created_at, grading_id);
+CREATE INDEX IF NOT EXISTS idx_gradings_created ON gradings (created_at, grading_id);
+CREATE TABLE IF NOT EXISTS question_scores (
+    grading_id TEXT NOT NULL,
+    exam_hash TEXT NOT NULL,
+    student_id TEXT,
+    question_id TEXT,
+    position INTEGER NOT NULL,
+    score REAL,
+    max_points REAL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (grading_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_scores_exam_question ON question_scores (exam_hash, question_id, created_at, grading_id, position);
+CREATE INDEX IF NOT EXISTS idx_scores_student ON question_scores (student_id, created_at);
+"""
+
+
+def exam_hash(exam_text):
+    """Stable identifier of an exam paper (whitespace-insensitive, model-independent)"""
+    return hashlib.sha256(normalize_text(exam_text).encode('utf-8')).hexdigest()
+
+
+def _encode_cursor(created_at, grading_id, position=None):
+    cursor = f"{created_at!r}:{grading_id}"
+    return cursor if position is None else f"{cursor}:{position}"
+
+
+class InvalidCursorError(ValueError):
+    """A page cursor that was not produced by this store"""
+
+
+def _decode_cursor(cursor):
+    """(created_at, grading_id, position or None) of an opaque page cursor"""
+    parts = str(cursor).split(':')
+    try:
+        if len(parts) not in (2, 3) or not parts[1]:
+            raise ValueError
+        return float(parts[0]), parts[1], int(parts[2]) if len(parts) > 2 else None
+    except ValueError:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}") from None
+
+
+def _page_size(limit):
+    return max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+
+class ResultStore:
+    """
+    Persistent store of every extracted rubric and grading result (SQLite, WAL).
+    Writes are queued and committed by a background thread in batches, so
+    save_*() never waits on the disk; reads go through their own connection
+    and see everything written before the last flush(). Listings use keyset
+    pagination on (created_at, grading_id), which stays fast deep into a class.
+    """
+
+    def __init__(self, path=RESULT_STORE_PATH, batch_size=RESULT_STORE_BATCH_SIZE,
+                 flush_interval=RESULT_STORE_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        # Stores created before regrading existed lack the copy text and the supersession link
+        columns = [row[1] for row in self._writer.execute("PRAGMA table_info(gradings)")]
+        for column in ('student_text', 'superseded_by'):
+            if column not in columns:
+                self._writer.execute(f"ALTER TABLE gradings ADD COLUMN {column} TEXT")
+        self._writer.commit()
+        self._reader = self._connect()
+        self._read_lock = threading.Lock()
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, name="result-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL makes NORMAL safe against corruption; only the last transactions can be lost on power failure
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -- writes ---------------------------------------------------------------
+
+    def save_rubric(self, exam_text, rubric, model_name=None):
+        """Queue a rubric (kept once per exam); returns the exam hash"""
+        key = exam_hash(exam_text)
+        self._queue.put((
+            "INSERT OR IGNORE INTO rubrics (exam_hash, model_name, rubric, created_at) VALUES (?, ?, ?, ?)",
+            [(key, model_name, json.dumps(rubric, ensure_ascii=False), time.time())]
+        ))
+        return key
+
+    def update_rubric(self, exam_hash_value, rubric, model_name=None):
+        """Queue a corrected rubric replacing the stored one"""
+        self._queue.put((
+            "INSERT OR REPLACE INTO rubrics (exam_hash, model_name, rubric, created_at) VALUES (?, ?, ?, ?)",
+            [(exam_hash_value, model_name, json.dumps(rubric, ensure_ascii=False), time.time())]
+        ))
+
+    def save_grading(self, exam_hash_value, grading, student_id=None, student_text=None, replaces=None,
+                     grading_id=None):
+        """
+        Queue a grading result with one indexed row per graded question; returns its grading_id.
+        The copy text is kept so the class can be regraded when the rubric is corrected;
+        `replaces` is the grading_id a regrade supersedes (kept as history, out of listings and scores).
+        An explicit `grading_id` makes the save idempotent: saving it again overwrites the same rows
+        (queue workers may run a task twice).
+        """
+        if grading_id is None:
+            grading_id = uuid.uuid4().hex
+        else:
+            self._queue.put(("DELETE FROM question_scores WHERE grading_id = ?", [(grading_id,)]))
+        created_at = time.time()
+        copy_hash = hashlib.sha256(normalize_text(student_text).encode('utf-8')).hexdigest() \
+            if student_text is not None else None
+
+        scores = []
+        for position, item in enumerate(rubric_items(grading)):
+            _, question_id = item_question_id(item)
+            scores.append((grading_id, exam_hash_value, student_id,
+                           str(question_id) if question_id is not None else None,
+                           position, item_score(item), item_max_points(item), created_at))
+
+        total_score = grading.get('total_score') if isinstance(grading, dict) else None
+        max_total = grading.get('max_total') if isinstance(grading, dict) else None
+        if not isinstance(total_score, (int, float)):
+            total_score = sum(row[5] or 0 for row in scores) if scores else None
+        if not isinstance(max_total, (int, float)):
+            max_total = sum(row[6] or 0 for row in scores) if scores else None
+
+        self._queue.put((
+            "INSERT OR REPLACE INTO gradings (grading_id, exam_hash, student_id, copy_hash, student_text, total_score, "
+            "max_total, result, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(grading_id, exam_hash_value, student_id, copy_hash, student_text, total_score, max_total,
+              json.dumps(grading, ensure_ascii=False), created_at)]
+        ))
+        if replaces is not None:
+            self._queue.put(("UPDATE gradings SET superseded_by = ? WHERE grading_id = ?", [(grading_id, replaces)]))
+            self._queue.put(("DELETE FROM question_scores WHERE grading_id = ?", [(replaces,)]))
+        if scores:
+            self._queue.put((
+                "INSERT INTO question_scores (grading_id, exam_hash, student_id, question_id, position, score, "
+                "max_points, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                scores
+            ))
+        return grading_id
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Gather more writes until the batch is full, the interval expires or someone flushes
+            while len(batch) < self.batch_size and not isinstance(batch[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            waiters = [entry for entry in batch if isinstance(entry, threading.Event)]
+            writes = [entry for entry in batch if not isinstance(entry, threading.Event)]
+            if writes:
+                try:
+                    with self._writer:
+                        for sql, rows in writes:
+                            self._writer.executemany(sql, rows)
+                except sqlite3.Error as e:
+                    print(f"Result store write failed ({len(writes)} statements dropped): {e}")
+            for waiter in waiters:
+                waiter.set()
+            if self._closed and self._queue.empty():
+                return
+
+    def flush(self, timeout=None):
+        """Block until every write queued so far is committed"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        self._closed = True
+        self.flush()
+        self._thread.join(timeout=5)
+        self._writer.close()
+        self._reader.close()
+
+    # -- reads ----------------------------------------------------------------
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def get_rubric(self, exam_hash_value):
+        rows = self._query("SELECT rubric FROM rubrics WHERE exam_hash = ?", (exam_hash_value,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def get_grading(self, grading_id):
+        """Full stored grading (with its JSON result), or None"""
+        rows = self._query(
+            "SELECT grading_id, exam_hash, student_id, copy_hash, total_score, max_total, created_at, result "
+            "FROM gradings WHERE grading_id = ?", (grading_id,)
+        )
+        if not rows:
+            return None
+        record = self._grading_record(rows[0][:7])
+        record["grading_result"] = json.loads(rows[0][7])
+        return record
+
+    @staticmethod
+    def _grading_record(row):
+        grading_id, exam_hash_value, student_id, copy_hash, total_score, max_total, created_at = row
+        return {
+            "grading_id": grading_id,
+            "exam_hash": exam_hash_value,
+            "student_id": student_id,
+            "copy_hash": copy_hash,
+            "total_score": total_score,
+            "max_total": max_total,
+            "created_at": created_at,
+        }
+
+    def list_gradings(self, exam_hash=None, student_id=None, since=None, limit=DEFAULT_PAGE_SIZE, cursor=None,
+                      include_results=False, include_superseded=False):
+        """
+        One page of gradings, oldest first, filtered by exam and/or student.
+        Returns {"items": [...], "next_cursor": str or None}; pass next_cursor back to get the next page.
+        """
+        limit = _page_size(limit)
+        conditions, params = [], []
+        if not include_superseded:
+            conditions.append("superseded_by IS NULL")
+        if exam_hash is not None:
+            conditions.append("exam_hash = ?")
+            params.append(exam_hash)
+        if student_id is not None:
+            conditions.append("student_id = ?")
+            params.append(student_id)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if cursor:
+            created_at, grading_id, _ = _decode_cursor(cursor)
+            conditions.append("(created_at, grading_id) > (?, ?)")
+            params.extend([created_at, grading_id])
+
+        columns = "grading_id, exam_hash, student_id, copy_hash, total_score, max_total, created_at"
+        if include_results:
+            columns += ", result"
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._query(
+            f"SELECT {columns} FROM gradings {where} ORDER BY created_at, grading_id LIMIT ?",
+            params + [limit + 1]
+        )
+
+        items = []
+        for row in rows[:limit]:
+            record = self._grading_record(row[:7])
+            if include_results:
+                record["grading_result"] = json.loads(row[7])
+            items.append(record)
+        next_cursor = _encode_cursor(items[-1]["created_at"], items[-1]["grading_id"]) \
+            if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def question_scores(self, exam_hash, question_id=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """One page of per-question scores for an exam (e.g. every Q3 score), oldest first"""
+        limit = _page_size(limit)
+        conditions, params = ["exam_hash = ?"], [exam_hash]
+        if question_id is not None:
+            conditions.append("question_id = ?")
+            params.append(str(question_id))
+        if cursor:
+            created_at, grading_id, position = _decode_cursor(cursor)
+            conditions.append("(created_at, grading_id, position) > (?, ?, ?)")
+            params.extend([created_at, grading_id, position or 0])
+
+        rows = self._query(
+            "SELECT grading_id, student_id, question_id, score, max_points, created_at, position FROM question_scores "
+            f"WHERE {' AND '.join(conditions)} ORDER BY created_at, grading_id, position LIMIT ?",
+            params + [limit + 1]
+        )
+        items = [
+            {"grading_id": grading_id, "student_id": student_id, "question_id": qid,
+             "score": score, "max_points": max_points, "created_at": created_at}
+            for grading_id, student_id, qid, score, max_points, created_at, _ in rows[:limit]
+        ]
+        next_cursor = _encode_cursor(rows[limit - 1][5], rows[limit - 1][0], rows[limit - 1][6]) \
+            if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def current_gradings(self, exam_hash, page_size=1000):
+        """
+        Every grading of an exam not superseded by a regrade, with its copy text:
+        yields (record, student_text) pairs, oldest first, reading page by page.
+        """
+        cursor = None
+        while True:
+            conditions, params = "exam_hash = ? AND superseded_by IS NULL", [exam_hash]
+            if cursor:
+                conditions += " AND (created_at, grading_id) > (?, ?)"
+                params.extend(cursor)
+            rows = self._query(
+                "SELECT grading_id, exam_hash, student_id, copy_hash, total_score, max_total, created_at, "
+                f"result, student_text FROM gradings WHERE {conditions} ORDER BY created_at, grading_id LIMIT ?",
+                params + [page_size]
+            )
+            for row in rows:
+                record = self._grading_record(row[:7])
+                record["grading_result"] = json.loads(row[7])
+                yield record, row[8]
+            if len(rows) < page_size:
+                return
+            cursor = [rows[-1][6], rows[-1][0]]
+
+    def score_columns(self, exam_hash, question_id=None):
+        """
+        Every stored score of an exam as parallel columns (grading_id, question_id,
+        score, max_points), in one query; feeds analytics.ClassAnalytics.from_columns.
+        """
+        sql = "SELECT grading_id, question_id, score, max_points FROM question_scores WHERE exam_hash = ?"
+        params = [exam_hash]
+        if question_id is not None:
+            sql += " AND question_id = ?"
+            params.append(str(question_id))
+        rows = self._query(sql + " ORDER BY created_at, grading_id, position", params)
+        if not rows:
+            return [], [], [], []
+        grading_ids, question_ids, scores, max_points = zip(*rows)
+        return list(grading_ids), list(question_ids), list(scores), list(max_points)
+
+    def render_pdf(self, grading_id, generator=None, filename=None):
+        """Re-render a stored grading's report (no model call); PDF bytes, or the path if filename is given"""
+        record = self.get_grading(grading_id)
+        if record is None:
+            return None
+        if generator is None:
+            import pdf_generator
+            generator = pdf_generator.SmartPDFGenerator()
+        return generator.generate_pdf(record["grading_result"], filename)
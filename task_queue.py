@@ -0,0 +1,245 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+TASK_QUEUE_PATH = os.getenv(
+    "TASK_QUEUE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "tasks.sqlite3")
+)
+# How long a leased task stays invisible to other workers before it is handed out again
+TASK_VISIBILITY_TIMEOUT = float(os.getenv("TASK_VISIBILITY_TIMEOUT", "300"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "5"))
+# WAL needs shared memory, i.e. one host; workers on several hosts sharing the
+# queue file over a network mount must use the rollback journal ('DELETE')
+TASK_QUEUE_JOURNAL_MODE = os.getenv("TASK_QUEUE_JOURNAL_MODE", "WAL")
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    visible_at REAL NOT NULL,
+    lease_token TEXT,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_ready ON tasks (status, visible_at);
+"""
+
+
+class TaskQueue:
+    """
+    Durable task queue in one SQLite file, shared by any number of worker processes.
+    lease() hands a task to one worker and hides it for `visibility_timeout` seconds;
+    the worker ack()s it when done or nack()s it to retry later. A lease that
+    expires (worker crashed or stuck) makes the task visible again, so delivery
+    is at-least-once: handlers must be idempotent. After `max_attempts`
+    deliveries a task is dead-lettered (status 'dead') and kept for inspection.
+    """
+
+    def __init__(self, path=TASK_QUEUE_PATH, visibility_timeout=TASK_VISIBILITY_TIMEOUT,
+                 max_attempts=TASK_MAX_ATTEMPTS, journal_mode=TASK_QUEUE_JOURNAL_MODE):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        # Autocommit mode: every transaction below is opened explicitly
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+        # One connection shared by the threads of a process (e.g. Flask requests):
+        # only one of them may use it, and be inside a transaction, at a time
+        self._lock = threading.Lock()
+
+    def _transaction(self):
+        """
+        Write transaction taking the database lock up front, so two workers never lease the same task.
+        The connection lock is held for the whole transaction.
+        """
+        conn = self._conn
+        lock = self._lock
+
+        class Transaction:
+            def __enter__(self):
+                lock.acquire()
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                except BaseException:
+                    lock.release()
+                    raise
+                return conn
+
+            def __exit__(self, exc_type, exc, tb):
+                try:
+                    conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+                finally:
+                    lock.release()
+
+        return Transaction()
+
+    def enqueue(self, kind, payload, max_attempts=None, delay=0, task_id=None):
+        """Add a task (payload must be JSON-serializable); returns its task_id"""
+        task_id = task_id or uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO tasks (task_id, kind, payload, status, max_attempts, visible_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_id, kind, json.dumps(payload, ensure_ascii=False), QUEUED,
+                 max_attempts or self.max_attempts, now + delay, now)
+            )
+        return task_id
+
+    def lease(self, worker=None, visibility_timeout=None):
+        """
+        Take the oldest visible task, or None if there is none. Returns a dict with
+        task_id, kind, payload, attempts and the lease_token to ack/nack/extend it with.
+        """
+        timeout = visibility_timeout or self.visibility_timeout
+        now = time.time()
+        with self._transaction() as conn:
+            # Leases that expired on their last allowed attempt are not handed out again
+            conn.execute(
+                "UPDATE tasks SET status = ?, finished_at = ?, "
+                "error = COALESCE(error, 'lease expired on last attempt') "
+                "WHERE status = ? AND visible_at <= ? AND attempts >= max_attempts",
+                (DEAD, now, LEASED, now)
+            )
+            row = conn.execute(
+                "SELECT task_id, kind, payload, attempts FROM tasks "
+                "WHERE status IN (?, ?) AND visible_at <= ? ORDER BY visible_at LIMIT 1",
+                (QUEUED, LEASED, now)
+            ).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE tasks SET status = ?, attempts = attempts + 1, lease_token = ?, worker = ?, "
+                "visible_at = ?, started_at = COALESCE(started_at, ?) WHERE task_id = ?",
+                (LEASED, token, worker, now + timeout, now, row[0])
+            )
+        return {"task_id": row[0], "kind": row[1], "payload": json.loads(row[2]),
+                "attempts": row[3] + 1, "lease_token": token}
+
+    def extend(self, task_id, lease_token, visibility_timeout=None):
+        """Push back the lease deadline of a task still being worked on; False if the lease was lost"""
+        timeout = visibility_timeout or self.visibility_timeout
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET visible_at = ? WHERE task_id = ? AND lease_token = ? AND status = ?",
+                (time.time() + timeout, task_id, lease_token, LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def ack(self, task_id, lease_token, result=None):
+        """
+        Mark a task done. False when the lease was lost meanwhile (it expired and
+        another worker took the task), in which case that worker's outcome wins.
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = NULL, lease_token = NULL, finished_at = ? "
+                "WHERE task_id = ? AND lease_token = ? AND status = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(), task_id, lease_token, LEASED)
+            )
+        return cursor.rowcount == 1
+
+    def nack(self, task_id, lease_token, error=None, delay=None, retry=True):
+        """
+        Give a failed task back: it becomes visible again after `delay` seconds
+        (exponential backoff by default), or is dead-lettered when retry=False or
+        its attempts are used up. Returns the new status, or None if the lease was lost.
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM tasks WHERE task_id = ? AND lease_token = ? AND status = ?",
+                (task_id, lease_token, LEASED)
+            ).fetchone()
+            if row is None:
+                return None
+            attempts, max_attempts = row
+            now = time.time()
+            if not retry or attempts >= max_attempts:
+                conn.execute(
+                    "UPDATE tasks SET status = ?, error = ?, lease_token = NULL, finished_at = ? WHERE task_id = ?",
+                    (DEAD, error, now, task_id)
+                )
+                return DEAD
+            if delay is None:
+                delay = min(2 ** (attempts - 1), 300)
+            conn.execute(
+                "UPDATE tasks SET status = ?, error = ?, lease_token = NULL, visible_at = ? WHERE task_id = ?",
+                (QUEUED, error, now + delay, task_id)
+            )
+            return QUEUED
+
+    def requeue_dead(self, task_id=None):
+        """Give dead-lettered tasks (one, or all of them) a fresh set of attempts; returns how many"""
+        sql = "UPDATE tasks SET status = ?, attempts = 0, visible_at = ?, finished_at = NULL WHERE status = ?"
+        params = [QUEUED, time.time(), DEAD]
+        if task_id is not None:
+            sql += " AND task_id = ?"
+            params.append(task_id)
+        with self._transaction() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def purge(self, older_than):
+        """Delete done tasks finished more than `older_than` seconds ago; returns how many"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM tasks WHERE status = ? AND finished_at < ?", (DONE, time.time() - older_than)
+            ).rowcount
+
+    def get(self, task_id):
+        """Snapshot of a task (payload excluded), or None if unknown"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT task_id, kind, status, attempts, max_attempts, worker, result, error, "
+                "created_at, started_at, finished_at FROM tasks WHERE task_id = ?",
+                (task_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "task_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "attempts": row[3],
+            "max_attempts": row[4],
+            "worker": row[5],
+            "result": json.loads(row[6]) if row[6] is not None else None,
+            "error": row[7],
+            "created_at": row[8],
+            "started_at": row[9],
+            "finished_at": row[10],
+        }
+
+    def stats(self):
+        """Task count per status"""
+        counts = {QUEUED: 0, LEASED: 0, DONE: 0, DEAD: 0}
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        for status, count in rows:
+            counts[status] = count
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
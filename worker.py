@@ -0,0 +1,197 @@
+"""
+Standalone grading workers fed by the durable task queue (task_queue.py).
+
+    python worker.py --processes 4
+    python worker.py --stats
+    python worker.py --requeue-dead
+
+Every process leases one task at a time, keeps its lease alive while grading,
+persists the result in the result store and only then acks the task. Start
+more processes (on this host or on others sharing the queue file) to grade
+more copies in parallel; the API enqueues with TASK_QUEUE_PATH set.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+import metrics
+from task_queue import TaskQueue, TASK_QUEUE_PATH, TASK_VISIBILITY_TIMEOUT
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+# Idle workers check the queue this often (seconds)
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+
+
+class InvalidTaskError(Exception):
+    """A task that can never succeed (malformed payload): dead-lettered without retries"""
+
+
+def handle_correct(engine, store, payload, task_id):
+    """Rubric extraction + grading of one copy, stored under the task id so a redelivery overwrites it"""
+    exam_text = payload.get("exam_text")
+    student_text = payload.get("student_text")
+    if not exam_text or not student_text:
+        raise InvalidTaskError("Missing exam_text or student_text")
+
+    cache_info = {}
+    with metrics.collect_model_calls() as model_calls:
+        rubric = engine.extract_rubric(exam_text, cache_info=cache_info)
+        grading_result = engine.grade_student(
+            rubric, student_text, use_cache=not payload.get("force_regrade"), cache_info=cache_info
+        )
+
+    result = {"rubric_extracted": rubric, "grading_result": grading_result, "cache": cache_info,
+              "tokens": metrics.token_usage(model_calls)}
+    if store is not None:
+        result["exam_hash"] = store.save_rubric(exam_text, rubric, model_name=engine.model_name)
+        result["grading_id"] = store.save_grading(
+            result["exam_hash"], grading_result, student_id=payload.get("student_id"),
+            student_text=student_text, grading_id=task_id
+        )
+        # Acked only once the result is on disk
+        store.flush()
+    return result
+
+
+TASK_HANDLERS = {
+    "correct": handle_correct,
+}
+
+
+class Worker:
+    """Lease -> handle -> ack loop of one worker process"""
+
+    def __init__(self, queue, engine=None, store=None, name=None, poll_interval=WORKER_POLL_INTERVAL,
+                 handlers=None):
+        self.queue = queue
+        self.engine = engine
+        self.store = store
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.handlers = handlers or TASK_HANDLERS
+
+    def _get_engine(self):
+        if self.engine is None:
+            from core_logic import AutoCorrectAI
+            self.engine = AutoCorrectAI()
+        return self.engine
+
+    def _keep_leased(self, task, done):
+        """Extend the lease every third of the visibility timeout until the task is finished"""
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+        while not done.wait(interval):
+            if not self.queue.extend(task["task_id"], task["lease_token"]):
+                print(f"[{self.name}] lost the lease on task {task['task_id']}")
+                return
+
+    def run_once(self):
+        """Handle one task if one is visible; returns whether a task was leased"""
+        task = self.queue.lease(worker=self.name)
+        if task is None:
+            return False
+
+        handler = self.handlers.get(task["kind"])
+        if handler is None:
+            self.queue.nack(task["task_id"], task["lease_token"], error=f"Unknown task kind: {task['kind']}",
+                            retry=False)
+            return True
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_leased, args=(task, done), daemon=True)
+        heartbeat.start()
+        try:
+            result = handler(self._get_engine(), self.store, task["payload"], task["task_id"])
+        except InvalidTaskError as e:
+            # Retrying cannot help; anything else (model errors, malformed answers) is retried
+            self.queue.nack(task["task_id"], task["lease_token"], error=str(e), retry=False)
+        except Exception as e:
+            # The model circuit breaker says when the backend is worth trying again
+            status = self.queue.nack(task["task_id"], task["lease_token"], error=str(e),
+                                     delay=getattr(e, "retry_after", None))
+            print(f"[{self.name}] task {task['task_id']} failed (attempt {task['attempts']}, now {status}): {e}")
+        else:
+            if not self.queue.ack(task["task_id"], task["lease_token"], result):
+                print(f"[{self.name}] task {task['task_id']} finished after its lease was lost")
+        finally:
+            done.set()
+            heartbeat.join()
+        return True
+
+    def run(self, stop_event=None, max_tasks=None):
+        """Work until `stop_event` is set (or `max_tasks` tasks are handled); returns the count"""
+        handled = 0
+        while not (stop_event is not None and stop_event.is_set()):
+            if max_tasks is not None and handled >= max_tasks:
+                break
+            if self.run_once():
+                handled += 1
+            elif stop_event is not None:
+                stop_event.wait(self.poll_interval)
+            else:
+                time.sleep(self.poll_interval)
+        return handled
+
+
+def _worker_process(queue_path, visibility_timeout, stop_event):
+    # Ctrl-C reaches the whole process group: let the parent decide, and finish the current task
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    store = None
+    if os.getenv("RESULT_STORE_PATH") != "":
+        import result_store
+        store = result_store.ResultStore()
+    queue = TaskQueue(queue_path, visibility_timeout=visibility_timeout)
+    try:
+        Worker(queue, store=store).run(stop_event)
+    finally:
+        queue.close()
+        if store is not None:
+            store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AutoCorrectGPT grading workers")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument("--queue", default=TASK_QUEUE_PATH, help="task queue database (shared by all workers)")
+    parser.add_argument("--visibility-timeout", type=float, default=TASK_VISIBILITY_TIMEOUT)
+    parser.add_argument("--stats", action="store_true", help="print the task count per status and exit")
+    parser.add_argument("--requeue-dead", action="store_true", help="retry every dead-lettered task and exit")
+    args = parser.parse_args(argv)
+
+    if args.stats or args.requeue_dead:
+        queue = TaskQueue(args.queue)
+        if args.requeue_dead:
+            print(f"Requeued {queue.requeue_dead()} dead task(s)")
+        print(queue.stats())
+        queue.close()
+        return
+
+    # Fresh interpreters: no model client, thread or SQLite handle inherited from the parent
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    processes = [
+        context.Process(target=_worker_process, args=(args.queue, args.visibility_timeout, stop_event),
+                        name=f"grading-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    print(f"{len(processes)} worker(s) on {args.queue}")
+
+    def stop(signum, frame):
+        print("Stopping after the current tasks...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()